@@ -0,0 +1,187 @@
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+# Lower values are served first, as in the outbound rate limiter
+PRIORITIES = {'interactive': 0, 'batch': 1}
+
+# How often a waiting request's ``check`` runs
+CHECK_INTERVAL = 0.25
+
+
+class AdmissionRejected(Exception):
+    """The request was shed; the client should retry after ``retry_after`` seconds"""
+
+    def __init__(self, message, retry_after, reason):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class Ticket:
+    def __init__(self, client, priority):
+        self.client = client
+        self.priority = priority
+        self.enqueued = time.perf_counter()
+        self.granted = False
+
+
+class AdmissionController:
+    """Bounded admission of pipeline runs with per-client fair queuing.
+
+    At most ``max_in_flight`` runs execute at once, and each client has at
+    most ``client_max_in_flight`` of them. The rest wait in per-client FIFO
+    queues. Interactive requests are served before batch ones. Within a
+    priority, clients take turns (round robin), so a client with many queued
+    requests can't hold back one with a single request. Interactive requests
+    are rejected at once when ``max_queue`` are already waiting, when their
+    client has ``client_max_queue`` waiting, or after ``max_wait`` seconds.
+    Batch runs wait as long as needed, since their caller streams results anyway.
+    """
+
+    def __init__(self, max_in_flight=32, max_queue=64, client_max_in_flight=4, client_max_queue=8, max_wait=30.0):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.client_max_in_flight = client_max_in_flight
+        self.client_max_queue = client_max_queue
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        # priority -> client -> deque of tickets, clients in round-robin order
+        self._queues = {priority: OrderedDict() for priority in PRIORITIES.values()}
+        self._running = {}
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = {}
+        self.total_wait = 0.0
+        self.max_observed_wait = 0.0
+        # Moving average of run time, used to estimate Retry-After
+        self.average_run = 5.0
+
+    def _queued(self, priority=None):
+        queues = [self._queues[priority]] if priority is not None else self._queues.values()
+        return sum(len(tickets) for clients in queues for tickets in clients.values())
+
+    def _dispatch(self):
+        """Grant slots to waiting tickets in priority, then round-robin client order"""
+        granted = False
+        for clients in self._queues.values():
+            while self.in_flight < self.max_in_flight:
+                client = next((client for client in clients
+                               if self._running.get(client, 0) < self.client_max_in_flight), None)
+                if client is None:
+                    break
+                ticket = clients[client].popleft()
+                if clients[client]:
+                    clients.move_to_end(client)
+                else:
+                    del clients[client]
+                ticket.granted = True
+                self._start(client)
+                granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def _withdraw(self, clients, client, ticket):
+        clients[client].remove(ticket)
+        if not clients[client]:
+            del clients[client]
+
+    def _start(self, client):
+        self.in_flight += 1
+        self._running[client] = self._running.get(client, 0) + 1
+
+    def _finish(self, client, seconds):
+        self.in_flight -= 1
+        self._running[client] -= 1
+        if not self._running[client]:
+            del self._running[client]
+        self.average_run += 0.1 * (seconds - self.average_run)
+        self._dispatch()
+
+    def retry_after(self):
+        """Whole seconds until a slot is likely to free up for a new request"""
+        backlog = self._queued() / max(self.max_in_flight, 1) + 1
+        return max(1, math.ceil(self.average_run * backlog))
+
+    def _reject(self, message, reason):
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        return AdmissionRejected(message, self.retry_after(), reason)
+
+    def acquire(self, client, priority='interactive', check=None):
+        """Wait for a slot and return ``(release, waited_seconds)``; raises AdmissionRejected when shed.
+
+        ``priority`` must be one of PRIORITIES: only batch runs are exempt from shedding, so an
+        unknown value is refused rather than treated as batch.
+
+        ``check()`` is called while waiting and may raise to give up, e.g. once the client has gone.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        rank = PRIORITIES[priority]
+        ticket = Ticket(client, rank)
+        interactive = rank == PRIORITIES['interactive']
+        with self._cond:
+            clients = self._queues[rank]
+            if interactive and self._queued(rank) >= self.max_queue:
+                raise self._reject('Server is at capacity', 'queue_full')
+            if interactive and len(clients.get(client, ())) >= self.client_max_queue:
+                raise self._reject('Too many concurrent requests from this client', 'client_limit')
+            clients.setdefault(client, deque()).append(ticket)
+            self._dispatch()
+            deadline = ticket.enqueued + self.max_wait if interactive else None
+            while not ticket.granted:
+                remaining = deadline - time.perf_counter() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    self._withdraw(clients, client, ticket)
+                    raise self._reject('Timed out waiting for capacity', 'timeout')
+                if check is not None:
+                    try:
+                        check()
+                    except BaseException:
+                        self._withdraw(clients, client, ticket)
+                        raise
+                    remaining = CHECK_INTERVAL if remaining is None else min(remaining, CHECK_INTERVAL)
+                self._cond.wait(remaining)
+            waited = time.perf_counter() - ticket.enqueued
+            self.admitted += 1
+            self.total_wait += waited
+            self.max_observed_wait = max(self.max_observed_wait, waited)
+
+        started = time.perf_counter()
+        released = []
+
+        def release():
+            # Safe to call more than once, e.g. from both a generator and the response
+            with self._cond:
+                if not released:
+                    released.append(True)
+                    self._finish(client, time.perf_counter() - started)
+        return release, waited
+
+    @contextmanager
+    def admit(self, client, priority='interactive', check=None):
+        """Hold a slot for the duration of the block, yielding the seconds spent queued"""
+        release, waited = self.acquire(client, priority, check)
+        try:
+            yield waited
+        finally:
+            release()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'in_flight': self.in_flight,
+                'max_in_flight': self.max_in_flight,
+                'queued': {name: self._queued(rank) for name, rank in PRIORITIES.items()},
+                'max_queue': self.max_queue,
+                'client_max_in_flight': self.client_max_in_flight,
+                'clients_running': len(self._running),
+                'admitted': self.admitted,
+                'rejected': dict(self.rejected),
+                'average_wait_seconds': round(self.total_wait / self.admitted, 4) if self.admitted else 0.0,
+                'max_wait_seconds': round(self.max_observed_wait, 4),
+                'average_run_seconds': round(self.average_run, 3),
+                'retry_after_seconds': self.retry_after()
+            }
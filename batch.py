@@ -0,0 +1,163 @@
+"""Batch processing of JSONL requirement files.
+
+Each input line is either a JSON object or a bare JSON string. Objects may carry
+the requirement as ``requirement`` or as ``title``/``body`` (the layout of
+``requests.jsonl``), plus an optional ``id``/``request_id``.
+
+Usage:
+    python batch.py requirements.jsonl -o results.jsonl --concurrency 4
+    python batch.py requirements.jsonl -o results.jsonl --resume
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '4'))
+# Most requirements one /process/batch request may run at once, whatever ?concurrency it asks for
+BATCH_CONCURRENCY_MAX = int(os.getenv('BATCH_CONCURRENCY_MAX', '16'))
+
+
+def parse_record(line):
+    """Return ``(id, requirement)`` for one JSONL line"""
+    record = json.loads(line)
+    if isinstance(record, str):
+        return None, record
+    requirement = record.get('requirement')
+    if not requirement:
+        requirement = '\n\n'.join(part for part in (record.get('title'), record.get('body')) if part)
+    return record.get('id', record.get('request_id')), requirement
+
+
+def read_requirements(lines, offset=0, skip=()):
+    """Yield ``(line, id, requirement, error)`` for every non-blank line from ``offset`` on.
+
+    ``line`` is the zero-based line index in the input; lines listed in ``skip``
+    are passed over, which is how a run resumes.
+    """
+    for index, line in enumerate(lines):
+        if index < offset or index in skip or not line.strip():
+            continue
+        try:
+            record_id, requirement = parse_record(line)
+        except (ValueError, AttributeError) as e:
+            yield index, None, None, f"Invalid JSONL record: {str(e)}"
+            continue
+        yield index, record_id, requirement, None if requirement else 'No requirement provided'
+
+
+def process_batch(records, run_requirement, concurrency=BATCH_CONCURRENCY):
+    """Run ``run_requirement`` over ``records`` and yield results in completion order.
+
+    At most ``concurrency`` requirements are in flight; the input is consumed
+    lazily, so arbitrarily long files are never held in memory. The last item
+    yielded is a ``summary`` record with throughput figures.
+    """
+    def run(index, record_id, requirement, error):
+        started = time.time()
+        result = {'line': index, 'id': record_id}
+        if error:
+            result['error'] = error
+        else:
+            try:
+                result.update(run_requirement(requirement))
+            except Exception as e:
+                result['error'] = str(e)
+        result['elapsed_seconds'] = round(time.time() - started, 3)
+        return result
+
+    started = time.time()
+    processed = failed = agent_errors = tokens = 0
+    records = iter(records)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        in_flight = set()
+        exhausted = False
+        while in_flight or not exhausted:
+            while not exhausted and len(in_flight) < concurrency:
+                record = next(records, None)
+                if record is None:
+                    exhausted = True
+                    break
+                in_flight.add(executor.submit(run, *record))
+            if not in_flight:
+                break
+
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                processed += 1
+                if 'error' in result:
+                    failed += 1
+                agent_errors += len(result.get('errors', {}))
+                tokens += result.get('usage', {}).get('total_tokens', 0)
+                yield result
+
+    minutes = (time.time() - started) / 60
+    yield {'summary': {
+        'requirements': processed,
+        'failed': failed,
+        'agent_errors': agent_errors,
+        'total_tokens': tokens,
+        'elapsed_seconds': round(minutes * 60, 3),
+        'requirements_per_minute': round(processed / minutes, 2) if minutes else 0.0,
+        'tokens_per_minute': round(tokens / minutes, 2) if minutes else 0.0
+    }}
+
+
+def completed_lines(path):
+    """Input line indexes already present in an earlier output file"""
+    completed = set()
+    if not os.path.exists(path):
+        return completed
+    with open(path) as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue  # a partially written last line from an interrupted run
+            if 'line' in result and 'error' not in result:
+                completed.add(result['line'])
+    return completed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Process a JSONL file of business requirements.')
+    parser.add_argument('input', help='JSONL file of requirements, or - for stdin')
+    parser.add_argument('-o', '--output', help='JSONL file to write results to (default: stdout)')
+    parser.add_argument('-c', '--concurrency', type=int, default=BATCH_CONCURRENCY,
+                        help='requirements processed at once (default: %(default)s)')
+    parser.add_argument('--offset', type=int, default=0, help='skip the first N input lines')
+    parser.add_argument('--resume', action='store_true',
+                        help='append to --output, skipping lines it already holds results for')
+    args = parser.parse_args(argv)
+
+    if args.resume and not args.output:
+        parser.error('--resume requires --output')
+
+    from functools import partial
+    from app import run_requirement
+
+    skip = completed_lines(args.output) if args.resume else set()
+    source = sys.stdin if args.input == '-' else open(args.input)
+    output = open(args.output, 'a' if args.resume else 'w') if args.output else sys.stdout
+    try:
+        records = read_requirements(source, offset=args.offset, skip=skip)
+        batch_run = partial(run_requirement, priority='batch', endpoint='batch')
+        for result in process_batch(records, batch_run, concurrency=args.concurrency):
+            if 'summary' in result:
+                print(json.dumps(result['summary'], indent=2), file=sys.stderr)
+            else:
+                output.write(json.dumps(result) + '\n')
+                output.flush()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Microbenchmark for domain detection on large requirement documents.
+
+Compares the compiled single-pass DomainDetector against the original
+substring scans at increasing document sizes. Time per KB should stay flat for
+the detector, which shows it is linear in the input size.
+
+Usage:
+    python benchmarks/domain_detection_benchmark.py [--sizes 50 100 200 400 800] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from domain_detection import DomainDetector  # noqa: E402
+
+KEYWORDS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'domain_keywords.json')
+
+FILLER = (
+    'the system shall allow users to manage their accounts and view reports across regions '
+    'with audit logging role based access and configurable notifications for every border crossing '
+).split()
+
+
+def legacy_detect_domain(requirement):
+    """The original sequential substring scans, kept here as the baseline"""
+    requirement_lower = requirement.lower()
+    if any(word in requirement_lower for word in ['payment', 'ecommerce', 'shop', 'cart', 'order', 'product']):
+        return 'ecommerce'
+    elif any(word in requirement_lower for word in ['patient', 'medical', 'health', 'clinical', 'hospital']):
+        return 'healthcare'
+    elif any(word in requirement_lower for word in ['payment', 'bank', 'financial', 'transaction', 'money']):
+        return 'fintech'
+    return 'general'
+
+
+def make_document(size_kb, seed=0):
+    """Mostly filler text with domain keywords sprinkled through it"""
+    rng = random.Random(seed)
+    vocabulary = FILLER * 20 + ['patient', 'clinical', 'bank', 'payment', 'checkout', 'HIPAA', 'ledger']
+    words, length = [], 0
+    while length < size_kb * 1024:
+        word = rng.choice(vocabulary)
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words)
+
+
+def best_time(function, text, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(text)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50, 100, 200, 400, 800], help='document sizes in KB')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    detector = DomainDetector.from_file(KEYWORDS_PATH)
+    print(f"{'size_kb':>8} {'detector_ms':>12} {'us_per_kb':>10} {'legacy_ms':>10} {'domain':>12}")
+    for size in args.sizes:
+        text = make_document(size)
+        detector_seconds = best_time(detector.detect, text, args.repeat)
+        legacy_seconds = best_time(legacy_detect_domain, text, args.repeat)
+        domain = detector.detect(text)['domain']
+        print(f"{size:>8} {detector_seconds * 1000:>12.2f} {detector_seconds * 1e6 / size:>10.1f} "
+              f"{legacy_seconds * 1000:>10.2f} {domain:>12}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+"""Load test for POST /process against the mock OpenAI server.
+
+Starts benchmarks/mock_openai_server.py in a subprocess, serves app.py from
+this process with its clients pointed at the mock, and drives /process at
+increasing concurrency. Reports throughput, p50/p95/p99 latency and the
+app process's memory at each level, and writes the results as JSON.
+
+Usage:
+    python benchmarks/load_test.py --concurrency 1 4 16 32 --requests 64 --output results.json
+    python benchmarks/load_test.py --baseline results.json  # exit 1 on a regression
+
+Quotas are raised to effectively unlimited by default so the numbers
+measure the app rather than the rate limiter; pass --rpm/--tpm to include it.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from werkzeug.serving import make_server  # noqa: E402
+
+REQUIREMENT = (
+    'Request {index}: build an online store where customers browse products, add them to a cart and pay by card. '
+    'Orders must be tracked from payment to delivery and staff need a dashboard for inventory.'
+)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+
+def rss_mb():
+    """Current resident memory of this process, from /proc where available"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):
+        return None
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_mock(args):
+    command = [
+        sys.executable, os.path.join(ROOT, 'benchmarks', 'mock_openai_server.py'), '--port', str(args.mock_port),
+        '--latency', args.latency, '--token-rate', str(args.token_rate),
+        '--completion-tokens', str(args.completion_tokens), '--error-rate-429', str(args.error_rate_429),
+        '--error-rate-5xx', str(args.error_rate_5xx), '--retry-after', str(args.retry_after)
+    ]
+    mock = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = mock.stdout.readline()
+    if not line:
+        raise RuntimeError('Mock OpenAI server failed to start')
+    return mock, line.rsplit(' ', 1)[-1].strip()
+
+
+def start_app(args, base_url, workdir):
+    # app reads its configuration at import time
+    os.environ.update({
+        'OPENAI_BASE_URL': base_url,
+        'OPENAI_API_KEYS': ','.join(f"mock-{index}" for index in range(args.keys)),
+        'OPENAI_RPM_LIMIT': str(args.rpm),
+        'OPENAI_TPM_LIMIT': str(args.tpm),
+        'LLM_CACHE_PATH': '',
+        'RUN_STORE_PATH': '',
+        'RUN_HISTORY_PATH': '',
+        # Every request comes from one client with near-identical text; measure the pipeline,
+        # not admission control or near-duplicate reuse
+        'ADMISSION_ENABLED': 'false',
+        'SIMILARITY_MODE': 'off',
+        'JOB_DB_PATH': os.path.join(workdir, 'jobs.sqlite3')
+    })
+    import app
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def post_requirement(url, index, timeout):
+    payload = json.dumps({'requirement': REQUIREMENT.format(index=index), 'bypass_cache': True}).encode()
+    request = urllib.request.Request(f"{url}/process", data=payload, headers={'Content-Type': 'application/json'})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            body = json.loads(response.read())
+        ok = not body.get('errors')
+    except (urllib.error.URLError, OSError, ValueError):
+        ok = False
+    return time.perf_counter() - started, ok
+
+
+def run_level(url, concurrency, requests, timeout, first_index):
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        started = time.perf_counter()
+        outcomes = list(pool.map(lambda index: post_requirement(url, index, timeout),
+                                 range(first_index, first_index + requests)))
+        elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _ in outcomes)
+    memory = rss_mb()
+    return {
+        'concurrency': concurrency,
+        'requests': requests,
+        'errors': sum(1 for _, ok in outcomes if not ok),
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput_rps': round(requests / elapsed, 3),
+        'latency_seconds': {
+            'mean': round(sum(latencies) / len(latencies), 4),
+            'p50': round(percentile(latencies, 0.50), 4),
+            'p95': round(percentile(latencies, 0.95), 4),
+            'p99': round(percentile(latencies, 0.99), 4),
+            'max': round(latencies[-1], 4)
+        },
+        'rss_mb': round(memory, 1) if memory is not None else None,
+        'peak_rss_mb': round(peak_rss_mb(), 1)
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Levels whose throughput fell or whose p95 latency rose by more than ``tolerance``"""
+    previous = {level['concurrency']: level for level in baseline['levels']}
+    regressions = []
+    for level in results['levels']:
+        before = previous.get(level['concurrency'])
+        if before is None:
+            continue
+        if level['throughput_rps'] < before['throughput_rps'] * (1 - tolerance):
+            regressions.append(f"concurrency {level['concurrency']}: throughput "
+                               f"{before['throughput_rps']} -> {level['throughput_rps']} req/s")
+        if level['latency_seconds']['p95'] > before['latency_seconds']['p95'] * (1 + tolerance):
+            regressions.append(f"concurrency {level['concurrency']}: p95 latency "
+                               f"{before['latency_seconds']['p95']} -> {level['latency_seconds']['p95']} s")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-c', '--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32],
+                        help='concurrent clients at each level')
+    parser.add_argument('-n', '--requests', type=int, default=32, help='requests per level')
+    parser.add_argument('--timeout', type=float, default=300.0, help='per-request timeout in seconds')
+    parser.add_argument('--latency', default='lognormal:0.3:0.4', help='mock time to first token distribution')
+    parser.add_argument('--token-rate', type=float, default=400.0, help='mock completion tokens per second')
+    parser.add_argument('--completion-tokens', type=int, default=300, help='mock tokens per completion')
+    parser.add_argument('--error-rate-429', type=float, default=0.0)
+    parser.add_argument('--error-rate-5xx', type=float, default=0.0)
+    parser.add_argument('--retry-after', type=float, default=0.5)
+    parser.add_argument('--mock-port', type=int, default=0, help='mock server port (default: any free port)')
+    parser.add_argument('--keys', type=int, default=1, help='mock API keys in the client pool')
+    parser.add_argument('--rpm', type=int, default=1_000_000, help='per-key requests per minute')
+    parser.add_argument('--tpm', type=int, default=1_000_000_000, help='per-key tokens per minute')
+    parser.add_argument('-o', '--output', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', help='earlier results JSON to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed throughput drop or p95 rise against the baseline (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    mock, base_url = start_mock(args)
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            server, url = start_app(args, base_url, workdir)
+            post_requirement(url, -1, args.timeout)  # warm up imports and connections
+
+            results = {
+                'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'git_commit': git_commit(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'config': {name: value for name, value in vars(args).items() if name not in ('output', 'baseline')},
+                'levels': []
+            }
+            print(f"{'conc':>5} {'req/s':>8} {'p50_s':>7} {'p95_s':>7} {'p99_s':>7} {'errors':>6} {'rss_mb':>7}")
+            for level_index, concurrency in enumerate(args.concurrency):
+                level = run_level(url, concurrency, args.requests, args.timeout, level_index * args.requests)
+                results['levels'].append(level)
+                latency = level['latency_seconds']
+                print(f"{concurrency:>5} {level['throughput_rps']:>8.2f} {latency['p50']:>7.2f} {latency['p95']:>7.2f} "
+                      f"{latency['p99']:>7.2f} {level['errors']:>6} {level['rss_mb'] or 0:>7.1f}", flush=True)
+            server.shutdown()
+    finally:
+        mock.terminate()
+        mock.wait()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
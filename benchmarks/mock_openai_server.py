@@ -0,0 +1,268 @@
+"""Offline stand-in for the OpenAI chat-completions API, for load tests.
+
+Serves ``POST /v1/chat/completions`` with and without ``stream``. Each
+response waits for a sampled time to first token, then generates
+``--completion-tokens`` at ``--token-rate`` tokens per second, truncated
+with ``finish_reason: length`` when ``max_tokens`` is smaller. A share of requests can be failed with 429 (with
+``Retry-After``) or 5xx responses.
+
+With ``response_format: json_object`` the answer is a JSON object with one
+``{"score", "assessment"}`` member of ``--completion-tokens`` per
+``"key": {`` the prompt's schema names. ``--prompt-cache`` reports
+``cached_tokens`` like OpenAI's prompt caching: the longest prefix seen in an
+earlier request, from 1024 tokens in steps of 128, once that request's
+prompt has been processed.
+
+Usage:
+    python benchmarks/mock_openai_server.py --port 8100 --latency lognormal:0.4:0.5 --error-rate-429 0.02
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1 OPENAI_API_KEY=mock python app.py
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = (
+    'the system shall validate each request and record an audit entry for every change to customer data '
+    'so that operators can trace failures across services within the agreed response time'
+).split()
+
+# Prompt caching granularity, in characters at the four characters per token count_prompt_tokens assumes
+CACHE_MIN_CHARS = 1024 * 4
+CACHE_BLOCK_CHARS = 128 * 4
+
+
+def parse_latency(spec):
+    """``fixed:S``, ``uniform:LOW:HIGH``, ``normal:MEAN:STDDEV`` or ``lognormal:MEDIAN:SIGMA``, in seconds"""
+    kind, *values = spec.split(':')
+    values = [float(value) for value in values]
+    if kind == 'fixed' and len(values) == 1:
+        return lambda rng: values[0]
+    if kind == 'uniform' and len(values) == 2:
+        return lambda rng: rng.uniform(*values)
+    if kind == 'normal' and len(values) == 2:
+        return lambda rng: max(0.0, rng.gauss(*values))
+    if kind == 'lognormal' and len(values) == 2:
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Invalid latency distribution: {spec}")
+
+
+class MockConfig:
+    def __init__(self, latency='fixed:0.2', token_rate=200.0, completion_tokens=400,
+                 error_rate_429=0.0, error_rate_5xx=0.0, retry_after=1.0, seed=None, prompt_cache=False):
+        self.latency = latency
+        self.sample_latency = parse_latency(latency)
+        self.token_rate = token_rate
+        self.completion_tokens = completion_tokens
+        self.error_rate_429 = error_rate_429
+        self.error_rate_5xx = error_rate_5xx
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.prompt_cache = prompt_cache
+        self.prefixes = set()
+
+    def sample(self):
+        """Draw one request's outcome: (status, time to first token)"""
+        with self._lock:
+            self.requests += 1
+            roll = self.rng.random()
+            latency = self.sample_latency(self.rng)
+            if roll < self.error_rate_429:
+                status = 429
+            elif roll < self.error_rate_429 + self.error_rate_5xx:
+                status = self.rng.choice((500, 502, 503))
+            else:
+                status = 200
+            if status != 200:
+                self.errors += 1
+        return status, latency
+
+    def lookup_prompt(self, text):
+        """``(cached_tokens, prefixes)`` for a prompt as it arrives; pass ``prefixes`` to cache_prompt()"""
+        if not self.prompt_cache:
+            return 0, []
+        lengths = range(CACHE_MIN_CHARS, len(text) + 1, CACHE_BLOCK_CHARS)
+        digests = [(length, hashlib.sha1(text[:length].encode()).digest()) for length in lengths]
+        with self._lock:
+            cached = max((length for length, digest in digests if digest in self.prefixes), default=0)
+        return cached // 4, [digest for _, digest in digests]
+
+    def cache_prompt(self, prefixes):
+        """Make a processed prompt's prefixes available to later requests"""
+        with self._lock:
+            self.prefixes.update(prefixes)
+
+
+def count_prompt_tokens(messages):
+    return sum(len(str(message.get('content', ''))) // 4 + 4 for message in messages)
+
+
+def completion_text(tokens):
+    # Roughly one token per word; validators ask for a 1-10 score, so report one
+    words = [WORDS[index % len(WORDS)] for index in range(max(tokens - 4, 1))]
+    return 'Completeness Score: 8/10. ' + ' '.join(words)
+
+
+def json_completion(prompt, tokens):
+    """A JSON answer with a scored assessment per key the prompt's schema names, and its length in tokens"""
+    keys = list(dict.fromkeys(re.findall(r'"(\w+)": \{', prompt))) or ['result']
+    words = ' '.join(WORDS[index % len(WORDS)] for index in range(max(tokens - 8, 1)))
+    return json.dumps({key: {'score': 8, 'assessment': words} for key in keys}), tokens * len(keys)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    config = MockConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/models'):
+            self._json(200, {'object': 'list', 'data': [{'id': 'gpt-3.5-turbo', 'object': 'model'}]})
+        else:
+            self._json(404, {'error': {'message': 'Not found', 'type': 'invalid_request_error'}})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            return self._json(404, {'error': {'message': 'Not found', 'type': 'invalid_request_error'}})
+        messages = body.get('messages', [])
+        prompt = ''.join(str(message.get('content', '')) for message in messages)
+        cached_tokens, prefixes = self.config.lookup_prompt(prompt)
+
+        status, first_token = self.config.sample()
+        time.sleep(first_token)
+        if status == 429:
+            return self._json(429, {'error': {'message': 'Rate limit reached', 'type': 'requests'}},
+                              {'Retry-After': str(self.config.retry_after)})
+        if status != 200:
+            return self._json(status, {'error': {'message': 'The server had an error', 'type': 'server_error'}})
+        # The prompt has been processed by the time the first token is sent
+        self.config.cache_prompt(prefixes)
+
+        model = body.get('model', 'gpt-3.5-turbo')
+        # Answers are --completion-tokens long (per member in JSON mode); a smaller max_tokens truncates them
+        if (body.get('response_format') or {}).get('type') == 'json_object':
+            text, full = json_completion(prompt, self.config.completion_tokens)
+            tokens = min(body.get('max_tokens') or full, full)
+            text = text[:len(text) * tokens // full]
+        else:
+            full = self.config.completion_tokens
+            tokens = min(body.get('max_tokens') or full, full)
+            text = completion_text(tokens)
+        finish_reason = 'length' if tokens < full else 'stop'
+        usage = {
+            'prompt_tokens': count_prompt_tokens(messages),
+            'completion_tokens': tokens,
+            'prompt_tokens_details': {'cached_tokens': cached_tokens},
+        }
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+        if body.get('stream'):
+            try:
+                self._stream(model, text, usage, finish_reason, (body.get('stream_options') or {}).get('include_usage'))
+            except (BrokenPipeError, ConnectionResetError):
+                # The client hung up mid-stream, e.g. a cancelled hedge
+                self.close_connection = True
+        else:
+            time.sleep(tokens / self.config.token_rate)
+            self._json(200, {
+                'id': f"chatcmpl-{uuid.uuid4().hex}",
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': finish_reason}],
+                'usage': usage
+            })
+
+    def _json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, model, text, usage, finish_reason, include_usage):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+        def send(payload):
+            data = f"data: {payload}\n\n".encode()
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b'\r\n')
+            self.wfile.flush()
+
+        def chunk(delta, finish_reason=None, chunk_usage=None):
+            send(json.dumps({
+                'id': chunk_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}] if delta is not None else [],
+                'usage': chunk_usage
+            }))
+
+        chunk({'role': 'assistant', 'content': ''})
+        interval = 1 / self.config.token_rate
+        for word in text.split(' '):
+            time.sleep(interval)
+            chunk({'content': word + ' '})
+        chunk({}, finish_reason)
+        if include_usage:
+            chunk(None, chunk_usage=usage)
+        send('[DONE]')
+        self.wfile.write(b'0\r\n\r\n')
+        self.wfile.flush()
+
+
+def make_server(host='127.0.0.1', port=0, config=None):
+    """A threaded mock server; ``port=0`` picks a free port (see ``server.server_address``)"""
+    handler = type('ConfiguredMockHandler', (MockHandler,), {'config': config or MockConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--latency', default='fixed:0.2',
+                        help='time to first token: fixed:S, uniform:LOW:HIGH, normal:MEAN:SD or lognormal:MEDIAN:SIGMA')
+    parser.add_argument('--token-rate', type=float, default=200.0, help='completion tokens generated per second')
+    parser.add_argument('--completion-tokens', type=int, default=400, help='upper bound on tokens per completion')
+    parser.add_argument('--error-rate-429', type=float, default=0.0, help='share of requests answered with 429')
+    parser.add_argument('--error-rate-5xx', type=float, default=0.0, help='share of requests answered with 500/502/503')
+    parser.add_argument('--retry-after', type=float, default=1.0, help='Retry-After seconds sent with 429s')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--prompt-cache', action='store_true', help='report cached_tokens for repeated prompt prefixes')
+    args = parser.parse_args(argv)
+
+    config = MockConfig(args.latency, args.token_rate, args.completion_tokens,
+                        args.error_rate_429, args.error_rate_5xx, args.retry_after, args.seed, args.prompt_cache)
+    server = make_server(args.host, args.port, config)
+    print(f"Mock OpenAI server on http://{args.host}:{server.server_address[1]}/v1", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
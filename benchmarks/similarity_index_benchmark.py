@@ -0,0 +1,73 @@
+"""Microbenchmark for near-duplicate lookups in the requirement similarity index.
+
+Fills an in-memory SimilarityIndex with synthetic requirements and times
+lookups of lightly edited copies, which should match, and of unrelated
+requirements, which should not. Lookup time should stay flat as the index grows.
+
+Usage:
+    python benchmarks/similarity_index_benchmark.py [--sizes 1000 10000 50000] [--lookups 500]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from similarity_index import SimilarityIndex  # noqa: E402
+
+VOCABULARY = (
+    'user customer admin order payment cart product inventory report dashboard alert notification account '
+    'profile search filter export import schedule booking invoice refund shipment delivery review rating '
+    'message chat login password role permission audit log api integration sync mobile web offline'
+).split()
+
+
+def make_requirement(rng, words=120):
+    return ' '.join(rng.choice(VOCABULARY) for _ in range(words))
+
+
+def edit(rng, requirement, changes=2):
+    """Replace a few words, as when a sentence is reworded"""
+    words = requirement.split()
+    for _ in range(changes):
+        words[rng.randrange(len(words))] = rng.choice(VOCABULARY)
+    return ' '.join(words)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000], help='stored requirements')
+    parser.add_argument('--lookups', type=int, default=500)
+    parser.add_argument('--threshold', type=float, default=0.85)
+    args = parser.parse_args(argv)
+
+    print(f"{'entries':>8} {'add_ms':>8} {'hit_ms':>8} {'miss_ms':>8} {'recall':>7}")
+    for size in args.sizes:
+        rng = random.Random(size)
+        requirements = [make_requirement(rng) for _ in range(size)]
+        index = SimilarityIndex(max_entries=size)
+        started = time.perf_counter()
+        for number, requirement in enumerate(requirements):
+            index.add(f"run-{number}", requirement, 'general')
+        add_seconds = (time.perf_counter() - started) / size
+
+        targets = [rng.randrange(size) for _ in range(args.lookups)]
+        queries = [edit(rng, requirements[target]) for target in targets]
+        started = time.perf_counter()
+        found = [index.lookup(query, 'general', args.threshold) for query in queries]
+        hit_seconds = (time.perf_counter() - started) / args.lookups
+        recall = sum(1 for target, match in zip(targets, found) if match and match[0] == f"run-{target}") / args.lookups
+
+        unrelated = [make_requirement(rng) for _ in range(args.lookups)]
+        started = time.perf_counter()
+        for query in unrelated:
+            index.lookup(query, 'general', args.threshold)
+        miss_seconds = (time.perf_counter() - started) / args.lookups
+
+        print(f"{size:>8} {add_seconds * 1000:>8.3f} {hit_seconds * 1000:>8.3f} {miss_seconds * 1000:>8.3f} {recall:>7.2%}")
+
+
+if __name__ == '__main__':
+    main()
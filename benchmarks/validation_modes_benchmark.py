@@ -0,0 +1,136 @@
+"""Tokens and latency of the three validation modes against the mock OpenAI server.
+
+Runs multi_agent_validation() on synthetic specifications and stories in each
+VALIDATION_MODE: ``separate`` (three calls, the baseline), ``shared_prefix``
+(three calls opening with the same spec and stories) and ``consolidated`` (one
+JSON-mode call). The mock reports prompt-cache hits like OpenAI does, so
+cached prompt tokens show what prefix caching saves. Each mode gets its own
+texts so no mode hits another's cache.
+
+Usage:
+    python benchmarks/validation_modes_benchmark.py --runs 10 --spec-tokens 1800 --story-tokens 1000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mock_openai_server import MockConfig, make_server  # noqa: E402
+
+MODES = ('separate', 'shared_prefix', 'consolidated')
+
+FILLER = (
+    'the platform shall expose an order service that validates payment details stores an audit record '
+    'and notifies the warehouse so that customers see accurate delivery estimates across every region'
+).split()
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+
+def make_text(title, tokens, count_tokens):
+    """``title`` followed by filler lines, about ``tokens`` long"""
+    lines, size = [title], count_tokens(title)
+    while size < tokens:
+        line = f"- REQ-{len(lines)}: {' '.join(FILLER[len(lines) % 7:])}"
+        lines.append(line)
+        size += count_tokens(line) + 1
+    return '\n'.join(lines)
+
+
+def run_mode(app, router, config, mode, args):
+    from token_budget import count_tokens
+
+    processor = app.AdvancedRequirementProcessor(max_concurrency=3, router=router, validation_mode=mode)
+    latencies, totals, failed = [], {}, 0
+    requests_before = config.requests
+    for index in range(args.runs):
+        tech_spec = make_text(f"## Technical Analysis ({mode} run {index})", args.spec_tokens, count_tokens)
+        user_stories = make_text(f"## Product Owner Stories ({mode} run {index})", args.story_tokens, count_tokens)
+        context = app.PipelineContext(bypass_cache=True)
+        started = time.perf_counter()
+        processor.multi_agent_validation(tech_spec, user_stories, context)
+        latencies.append(time.perf_counter() - started)
+        for name, value in context.usage().items():
+            totals[name] = totals.get(name, 0) + value
+        failed += bool(context.errors)
+    latencies.sort()
+    per_run = {name: round(value / args.runs, 1) for name, value in totals.items()}
+    return {
+        'mode': mode,
+        'calls_per_run': (config.requests - requests_before) / args.runs,
+        'prompt_tokens': per_run['prompt_tokens'],
+        'cached_prompt_tokens': per_run['cached_prompt_tokens'],
+        'uncached_prompt_tokens': round(per_run['prompt_tokens'] - per_run['cached_prompt_tokens'], 1),
+        'completion_tokens': per_run['completion_tokens'],
+        'estimated_cost_usd': round(totals['estimated_cost_usd'] / args.runs, 6),
+        'latency_seconds': {'p50': percentile(latencies, 0.5), 'p95': percentile(latencies, 0.95)},
+        'failed_runs': failed
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--runs', type=int, default=10, help='validations per mode')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument('--spec-tokens', type=int, default=1800, help='size of each technical specification')
+    parser.add_argument('--story-tokens', type=int, default=1000, help='size of each set of user stories')
+    parser.add_argument('--latency', default='fixed:0.5', help='mock time to first token distribution')
+    parser.add_argument('--token-rate', type=float, default=200.0, help='mock completion tokens per second')
+    parser.add_argument('--completion-tokens', type=int, default=400, help='mock tokens per assessment')
+    parser.add_argument('-o', '--output', help='write the results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    config = MockConfig(args.latency, args.token_rate, args.completion_tokens, prompt_cache=True)
+    server = make_server(config=config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # app reads its configuration at import time
+        os.environ.update({
+            'OPENAI_BASE_URL': f"http://127.0.0.1:{server.server_address[1]}/v1",
+            'OPENAI_API_KEYS': 'mock',
+            'OPENAI_RPM_LIMIT': '1000000',
+            'OPENAI_TPM_LIMIT': '1000000000',
+            'LLM_CACHE_PATH': '',
+            'RUN_STORE_PATH': '',
+            'RUN_HISTORY_PATH': '',
+            'SIMILARITY_MODE': 'off',
+            'JOB_DB_PATH': os.path.join(workdir, 'jobs.sqlite3')
+        })
+        import app
+        from model_routing import ModelRouter
+
+        # Fixed budgets, so every mode is measured with the configured max_tokens
+        router = ModelRouter.from_file(app.AGENT_MODELS_PATH, adaptive=False)
+        print(f"{'mode':>14} {'calls':>6} {'prompt':>8} {'cached':>8} {'uncached':>9} {'completion':>11} "
+              f"{'cost_usd':>9} {'p50_s':>6} {'p95_s':>6} {'failed':>6}")
+        results = []
+        for mode in args.modes:
+            result = run_mode(app, router, config, mode, args)
+            results.append(result)
+            print(f"{mode:>14} {result['calls_per_run']:>6.1f} {result['prompt_tokens']:>8.0f} "
+                  f"{result['cached_prompt_tokens']:>8.0f} {result['uncached_prompt_tokens']:>9.0f} "
+                  f"{result['completion_tokens']:>11.0f} {result['estimated_cost_usd']:>9.5f} "
+                  f"{result['latency_seconds']['p50']:>6.2f} {result['latency_seconds']['p95']:>6.2f} "
+                  f"{result['failed_runs']:>6}", flush=True)
+    server.shutdown()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'config': {name: value for name, value in vars(args).items() if name != 'output'},
+                       'modes': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+import itertools
+import select
+import socket
+import threading
+import time
+
+REASONS = {
+    'deadline': 'Deadline exceeded',
+    'disconnect': 'The client disconnected',
+    'cancelled': 'Cancelled by the client'
+}
+
+
+class PipelineCancelled(Exception):
+    """The run was cancelled, so a call was dropped before or while it ran"""
+
+    def __init__(self, reason):
+        super().__init__(REASONS.get(reason, reason))
+        self.reason = reason
+
+
+def disconnected(sock):
+    """Whether the peer of ``sock`` has closed the connection; reads nothing from it"""
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        # Readable with nothing to read means end of stream
+        return bool(readable) and sock.recv(1, socket.MSG_PEEK) == b''
+    except ConnectionError:
+        return True
+    except (OSError, ValueError):
+        # Closed by the server already, TLS, or a descriptor select() can't take
+        return False
+
+
+class Watchdog:
+    """Cancels pipeline runs whose deadline has passed or whose client has gone.
+
+    One background thread checks every watched run each ``interval``
+    seconds. A run is cancelled once ``context.expired()``, or when its
+    ``probe()`` returns a reason such as ``'disconnect'``. Calls check the
+    cancellation themselves, so queued calls are never sent and streamed
+    ones hang up; each reports what that lost or saved to ``record_call``.
+    """
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self._watched = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.watched = 0
+        self.cancelled = {}
+        self.calls_cancelled = 0
+        self.tokens_wasted = 0
+        self.tokens_saved = 0
+
+    def watch(self, context, probe=None):
+        """Watch ``context`` until the returned function is called"""
+        key = next(self._ids)
+        with self._lock:
+            self._watched[key] = (context, probe)
+            self.watched += 1
+            # Started lazily, so each server process runs its own after forking
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+        def unwatch():
+            with self._lock:
+                if self._watched.pop(key, None) is not None and context.cancel_reason is not None:
+                    self.cancelled[context.cancel_reason] = self.cancelled.get(context.cancel_reason, 0) + 1
+        return unwatch
+
+    def record_call(self, wasted, saved):
+        """Count a call dropped by a cancelled run, which may still be draining after it is unwatched"""
+        with self._lock:
+            self.calls_cancelled += 1
+            self.tokens_wasted += wasted
+            self.tokens_saved += saved
+
+    def check(self):
+        """Cancel the watched runs that are due; returns how many were cancelled"""
+        with self._lock:
+            watched = list(self._watched.values())
+        count = 0
+        for context, probe in watched:
+            if context.cancelled.is_set():
+                continue
+            reason = 'deadline' if context.expired() else self._probe(probe)
+            if reason:
+                context.cancel(reason)
+                count += 1
+        return count
+
+    def _probe(self, probe):
+        if probe is None:
+            return None
+        try:
+            return probe()
+        except Exception:
+            # A failing probe (e.g. the job database is locked) is tried again next time
+            return None
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.check()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'interval_seconds': self.interval,
+                'in_flight': len(self._watched),
+                'watched': self.watched,
+                'runs_cancelled': dict(self.cancelled),
+                'calls_cancelled': self.calls_cancelled,
+                'tokens_wasted': self.tokens_wasted,
+                'tokens_saved': self.tokens_saved
+            }
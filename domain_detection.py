@@ -0,0 +1,75 @@
+import json
+import re
+from collections import defaultdict
+
+DEFAULT_DOMAIN = 'general'
+
+
+class DomainDetector:
+    """Single-pass, weighted keyword scoring of a requirement against configured domains.
+
+    All keywords are compiled into one word-bounded regular expression that runs
+    over the lowercased text, so a requirement is scanned once however many domains are
+    configured, and "order" no longer matches inside "border". A keyword may
+    belong to several domains (e.g. "payment"); each match adds the keyword's
+    weight to every domain that lists it.
+    """
+
+    def __init__(self, domains, min_score=1, related_ratio=0.5):
+        self.domains = list(domains)
+        self.min_score = min_score
+        self.related_ratio = related_ratio
+        self.weights = defaultdict(list)
+        for domain, config in domains.items():
+            for keyword, weight in config.get('keywords', {}).items():
+                self.weights[self._normalise(keyword)].append((domain, weight))
+
+        # Longest keywords first so "medical records" wins over "medical"
+        alternatives = sorted(self.weights, key=len, reverse=True)
+        pattern = '|'.join(r'\s+'.join(re.escape(word) for word in keyword.split()) for keyword in alternatives)
+        # Matching lowercased text is several times faster than re.IGNORECASE
+        self.pattern = re.compile(rf"\b({pattern})(?:s|es)?\b") if alternatives else None
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        with open(path) as f:
+            return cls(json.load(f), **kwargs)
+
+    @staticmethod
+    def _normalise(keyword):
+        return ' '.join(keyword.lower().split())
+
+    def detect(self, text):
+        """Score ``text`` and return the best domain, its confidence and every related domain"""
+        scores = dict.fromkeys(self.domains, 0)
+        matches = defaultdict(int)
+        if self.pattern is not None:
+            for match in self.pattern.finditer(text.lower()):
+                keyword = self._normalise(match.group(1))
+                matches[keyword] += 1
+                for domain, weight in self.weights[keyword]:
+                    scores[domain] += weight
+
+        total = sum(scores.values())
+        # max() keeps the first configured domain on ties
+        best = max(self.domains, key=lambda domain: scores[domain]) if self.domains else None
+        if best is None or scores[best] < self.min_score:
+            return {
+                'domain': DEFAULT_DOMAIN,
+                'confidence': 0.0,
+                'domains': [],
+                'scores': scores,
+                'matched_keywords': dict(matches)
+            }
+
+        related = sorted(
+            (domain for domain in self.domains if scores[domain] >= scores[best] * self.related_ratio),
+            key=lambda domain: scores[domain], reverse=True
+        )
+        return {
+            'domain': best,
+            'confidence': round(scores[best] / total, 4),
+            'domains': [{'domain': domain, 'score': scores[domain]} for domain in related],
+            'scores': scores,
+            'matched_keywords': dict(matches)
+        }
@@ -0,0 +1,177 @@
+import math
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+
+
+class LatencyTracker:
+    """Recent successful-call latencies per agent"""
+
+    def __init__(self, window=200):
+        self.window = window
+        self._latencies = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def observe(self, agent, seconds):
+        with self._lock:
+            self._latencies[agent].append(seconds)
+
+    def percentile(self, agent, fraction, min_samples=1):
+        """Nearest-rank percentile, or None until ``min_samples`` calls have been seen"""
+        with self._lock:
+            samples = sorted(self._latencies[agent])
+        if len(samples) < max(min_samples, 1):
+            return None
+        return samples[min(len(samples) - 1, max(0, math.ceil(fraction * len(samples)) - 1))]
+
+
+class Attempt:
+    """Cancellation handle for one attempt of a call.
+
+    Behaves like a ``threading.Event``; ``set()`` also runs the closers the
+    attempt registered, so an attempt blocked reading a response can be
+    woken from another thread instead of waiting for its read timeout.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._closers = []
+        self._lock = threading.Lock()
+
+    def is_set(self):
+        return self._event.is_set()
+
+    def on_cancel(self, close):
+        """Run ``close()`` when the attempt is cancelled, at once if it already is; returns a function to unregister it"""
+        with self._lock:
+            if not self._event.is_set():
+                self._closers.append(close)
+                return lambda: self._discard(close)
+        close()
+        return lambda: None
+
+    def _discard(self, close):
+        with self._lock:
+            if close in self._closers:
+                self._closers.remove(close)
+
+    def set(self):
+        with self._lock:
+            self._event.set()
+            closers, self._closers = self._closers, []
+        for close in closers:
+            close()
+
+
+class Hedger:
+    """Sends a duplicate of an agent call that is slower than usual; the first response wins.
+
+    Once an agent has ``min_samples`` observed latencies, a call still running
+    after the ``percentile`` of them gets a second, identical attempt. The
+    slower attempt is cancelled through its ``Attempt`` handle. Hedges
+    are capped at ``max_ratio`` of all calls so the extra spend stays bounded.
+    """
+
+    def __init__(self, percentile=0.95, max_ratio=0.1, min_samples=20, tracker=None):
+        self.percentile = percentile
+        self.max_ratio = max_ratio
+        self.min_samples = min_samples
+        self.tracker = tracker or LatencyTracker()
+        self.calls = 0
+        self.hedged = 0
+        self.wins = 0
+        self.skipped = 0
+        self._agents = defaultdict(lambda: {'calls': 0, 'hedged': 0, 'wins': 0})
+        self._lock = threading.Lock()
+
+    def delay(self, agent):
+        return self.tracker.percentile(agent, self.percentile, self.min_samples)
+
+    def _reserve_hedge(self, agent):
+        with self._lock:
+            if self.hedged + 1 > self.max_ratio * self.calls:
+                self.skipped += 1
+                return False
+            self.hedged += 1
+            self._agents[agent]['hedged'] += 1
+            return True
+
+    def call(self, agent, attempt):
+        """Return ``attempt(cancelled)``, hedged with a second attempt if the first is slow.
+
+        ``attempt`` is given an ``Attempt``. It should return early once the
+        handle is set, and register a closer for whatever it may block on; the
+        result of a cancelled attempt is discarded.
+        """
+        with self._lock:
+            self.calls += 1
+            self._agents[agent]['calls'] += 1
+        delay = self.delay(agent)
+        if delay is None:
+            started = time.perf_counter()
+            result = attempt(Attempt())
+            self.tracker.observe(agent, time.perf_counter() - started)
+            return result
+
+        results = queue.Queue()
+        cancelled = (Attempt(), Attempt())
+
+        def run(index):
+            started = time.perf_counter()
+            try:
+                result = attempt(cancelled[index])
+            except Exception as e:
+                results.put((index, None, e))
+                return
+            if not cancelled[index].is_set():
+                self.tracker.observe(agent, time.perf_counter() - started)
+            results.put((index, result, None))
+
+        threading.Thread(target=run, args=(0,), daemon=True).start()
+        try:
+            index, result, error = results.get(timeout=delay)
+            return self._outcome(result, error)
+        except queue.Empty:
+            pass
+
+        if not self._reserve_hedge(agent):
+            index, result, error = results.get()
+            return self._outcome(result, error)
+
+        threading.Thread(target=run, args=(1,), daemon=True).start()
+        index, result, error = results.get()
+        if error is not None:
+            # The other attempt may still succeed
+            index, result, error = results.get()
+        cancelled[1 - index].set()
+        if index == 1 and error is None:
+            with self._lock:
+                self.wins += 1
+                self._agents[agent]['wins'] += 1
+        return self._outcome(result, error)
+
+    def _outcome(self, result, error):
+        if error is not None:
+            raise error
+        return result
+
+    def stats(self):
+        with self._lock:
+            agents = {agent: dict(counts) for agent, counts in self._agents.items()}
+            stats = {
+                'percentile': self.percentile,
+                'max_ratio': self.max_ratio,
+                'min_samples': self.min_samples,
+                'calls': self.calls,
+                'hedged': self.hedged,
+                'hedge_wins': self.wins,
+                'skipped_over_ratio': self.skipped,
+                'hedge_ratio': round(self.hedged / self.calls, 4) if self.calls else 0.0,
+                'win_rate': round(self.wins / self.hedged, 4) if self.hedged else 0.0
+            }
+        for agent, counts in agents.items():
+            delay = self.delay(agent)
+            counts['hedge_after_seconds'] = round(delay, 4) if delay is not None else None
+        stats['agents'] = agents
+        return stats
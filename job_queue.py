@@ -0,0 +1,205 @@
+import json
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+import sqlite_offload
+
+# Jobs whose worker stops renewing its lease are handed to another worker
+LEASE_SECONDS = 60
+MAX_ATTEMPTS = 3
+
+
+class JobQueue:
+    """Durable FIFO of pipeline jobs stored in SQLite.
+
+    Any number of worker threads or processes can drain the queue. With
+    ``journal_mode='delete'`` they may also run on other machines sharing
+    the database file, if its filesystem supports POSIX locks. A worker claims a job
+    under a lease that it renews while working. If the worker dies, the
+    lease expires and the job is picked up again, up to ``MAX_ATTEMPTS``
+    times, so queued and interrupted jobs survive restarts.
+    """
+
+    def __init__(self, path, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS, journal_mode='wal'):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self.db = sqlite_offload.connect(
+            path, journal_mode, timeout=30, check_same_thread=False, isolation_level=None
+        )
+        self.db.row_factory = sqlite3.Row
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            'id TEXT PRIMARY KEY, status TEXT NOT NULL, requirement TEXT NOT NULL, options TEXT NOT NULL, '
+            'partial TEXT, result TEXT, error TEXT, worker TEXT, attempts INTEGER NOT NULL DEFAULT 0, '
+            'lease_expires REAL, created_at REAL NOT NULL, started_at REAL, updated_at REAL, finished_at REAL, '
+            'polled_at REAL)'
+        )
+        # Databases created before jobs tracked their pollers
+        columns = [row['name'] for row in self.db.execute('PRAGMA table_info(jobs)')]
+        if 'polled_at' not in columns:
+            self.db.execute('ALTER TABLE jobs ADD COLUMN polled_at REAL')
+        self.db.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)')
+
+    def enqueue(self, requirement, options=None):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self.db.execute(
+                'INSERT INTO jobs (id, status, requirement, options, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (job_id, 'queued', requirement, json.dumps(options or {}), now, now)
+            )
+        return job_id
+
+    def claim(self, worker):
+        """Atomically take the oldest runnable job, or return None when the queue is empty"""
+        now = time.time()
+        with self._lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                # Jobs whose lease ran out on their last allowed attempt are given up on
+                self.db.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'Worker lease expired too many times', "
+                    "finished_at = ?, updated_at = ? WHERE status = 'running' AND lease_expires < ? AND attempts >= ?",
+                    (now, now, now, self.max_attempts)
+                )
+                row = self.db.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' OR (status = 'running' AND lease_expires < ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (now,)
+                ).fetchone()
+                if row is not None:
+                    self.db.execute(
+                        "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, lease_expires = ?, "
+                        "started_at = COALESCE(started_at, ?), updated_at = ? WHERE id = ?",
+                        (worker, now + self.lease_seconds, now, now, row['id'])
+                    )
+                    row = self.db.execute('SELECT * FROM jobs WHERE id = ?', (row['id'],)).fetchone()
+                self.db.execute('COMMIT')
+            except BaseException:
+                self.db.execute('ROLLBACK')
+                raise
+        return self._decode(row) if row is not None else None
+
+    def heartbeat(self, job_id, worker):
+        """Extend the lease; returns False if the job is no longer ours"""
+        now = time.time()
+        with self._lock:
+            cursor = self.db.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                (now + self.lease_seconds, now, job_id, worker)
+            )
+        return cursor.rowcount == 1
+
+    def update_partial(self, job_id, partial):
+        with self._lock:
+            self.db.execute(
+                'UPDATE jobs SET partial = ?, updated_at = ? WHERE id = ?',
+                (json.dumps(partial), time.time(), job_id)
+            )
+
+    def complete(self, job_id, worker, result):
+        """Store the result, unless the lease was lost and another worker now owns the job"""
+        now = time.time()
+        with self._lock:
+            self.db.execute(
+                "UPDATE jobs SET status = 'completed', result = ?, finished_at = ?, updated_at = ? "
+                "WHERE id = ? AND worker = ? AND status = 'running'",
+                (json.dumps(result), now, now, job_id, worker)
+            )
+
+    def fail(self, job_id, worker, error):
+        """Requeue the job for another attempt, or mark it failed once attempts run out"""
+        now = time.time()
+        with self._lock:
+            self.db.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts < ? THEN 'queued' ELSE 'failed' END, "
+                "error = ?, worker = NULL, lease_expires = NULL, "
+                "finished_at = CASE WHEN attempts < ? THEN NULL ELSE ? END, updated_at = ? "
+                "WHERE id = ? AND worker = ? AND status = 'running'",
+                (self.max_attempts, error, self.max_attempts, now, now, job_id, worker)
+            )
+
+    def cancel(self, job_id):
+        """Mark a queued or running job cancelled; returns False if it had already finished.
+
+        A queued job is never claimed; the worker running a job notices and stops its calls.
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self.db.execute(
+                "UPDATE jobs SET status = 'cancelled', worker = NULL, lease_expires = NULL, finished_at = ?, "
+                "updated_at = ? WHERE id = ? AND status IN ('queued', 'running')",
+                (now, now, job_id)
+            )
+        return cursor.rowcount == 1
+
+    def touch(self, job_id):
+        """Record that a client is still polling the job"""
+        with self._lock:
+            self.db.execute('UPDATE jobs SET polled_at = ? WHERE id = ?', (time.time(), job_id))
+
+    def liveness(self, job_id):
+        """``(status, seconds since the job was last polled or created)``, or None for an unknown job"""
+        with self._lock:
+            row = self.db.execute(
+                'SELECT status, COALESCE(polled_at, created_at) AS seen FROM jobs WHERE id = ?', (job_id,)
+            ).fetchone()
+        return (row['status'], time.time() - row['seen']) if row is not None else None
+
+    def get(self, job_id):
+        with self._lock:
+            row = self.db.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._decode(row) if row is not None else None
+
+    def stats(self):
+        with self._lock:
+            rows = self.db.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+        return {status: count for status, count in rows}
+
+    def _decode(self, row):
+        job = dict(row)
+        for field in ('options', 'partial', 'result'):
+            job[field] = json.loads(job[field]) if job[field] else None
+        return job
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{threading.get_native_id()}:{uuid.uuid4().hex[:6]}"
+
+
+def work(queue, handler, worker=None, stop=None, poll_interval=1.0):
+    """Claim and run jobs until ``stop`` is set.
+
+    ``handler(job, queue)`` returns the job's result. The lease is renewed in
+    the background while it runs. An exception from the handler counts as a
+    failed attempt.
+    """
+    worker = worker or default_worker_id()
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        job = queue.claim(worker)
+        if job is None:
+            stop.wait(poll_interval)
+            continue
+
+        finished = threading.Event()
+
+        def renew():
+            while not finished.wait(queue.lease_seconds / 3):
+                if not queue.heartbeat(job['id'], worker):
+                    return
+
+        renewer = threading.Thread(target=renew, daemon=True)
+        renewer.start()
+        try:
+            queue.complete(job['id'], worker, handler(job, queue))
+        except Exception as e:
+            queue.fail(job['id'], worker, str(e))
+        finally:
+            finished.set()
+            renewer.join()
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import sqlite_offload
+
+
+def completion_key(model, prompt, max_tokens, temperature):
+    """Stable hash of everything that determines a completion's output"""
+    payload = json.dumps([model, prompt, max_tokens, temperature], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class CompletionCache:
+    """Two-tier completion cache: an in-memory LRU in front of an SQLite store.
+
+    Entries expire after ``ttl`` seconds. The memory tier holds at most
+    ``memory_size`` entries and the disk tier at most ``max_entries``; the least
+    recently used entries are evicted first. Pass ``path=None`` to keep the
+    cache in memory only.
+    """
+
+    def __init__(self, path=None, ttl=86400, memory_size=256, max_entries=10000, journal_mode='wal'):
+        self.ttl = ttl
+        self.memory_size = memory_size
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.memory_hits = 0
+        self.misses = 0
+        self.db = None
+        if path:
+            self.db = sqlite_offload.connect(path, journal_mode, check_same_thread=False)
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS completions ('
+                'key TEXT PRIMARY KEY, content TEXT NOT NULL, '
+                'created_at REAL NOT NULL, accessed_at REAL NOT NULL)'
+            )
+            self.db.execute('CREATE INDEX IF NOT EXISTS completions_accessed ON completions (accessed_at)')
+            self.db.commit()
+
+    def get(self, key):
+        """Return the cached content for ``key``, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                content, created_at = entry
+                if now - created_at < self.ttl:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    self.memory_hits += 1
+                    return content
+                del self._memory[key]
+
+            if self.db is not None:
+                row = self.db.execute(
+                    'SELECT content, created_at FROM completions WHERE key = ?', (key,)
+                ).fetchone()
+                if row is not None:
+                    content, created_at = row
+                    if now - created_at < self.ttl:
+                        self.db.execute('UPDATE completions SET accessed_at = ? WHERE key = ?', (now, key))
+                        self.db.commit()
+                        self._remember(key, content, created_at)
+                        self.hits += 1
+                        return content
+                    self.db.execute('DELETE FROM completions WHERE key = ?', (key,))
+                    self.db.commit()
+
+            self.misses += 1
+            return None
+
+    def set(self, key, content):
+        now = time.time()
+        with self._lock:
+            self._remember(key, content, now)
+            if self.db is not None:
+                self.db.execute(
+                    'INSERT OR REPLACE INTO completions (key, content, created_at, accessed_at) VALUES (?, ?, ?, ?)',
+                    (key, content, now, now)
+                )
+                self.db.execute(
+                    'DELETE FROM completions WHERE key IN ('
+                    'SELECT key FROM completions ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)',
+                    (self.max_entries,)
+                )
+                self.db.commit()
+
+    def _remember(self, key, content, created_at):
+        self._memory[key] = (content, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self.db is not None:
+                self.db.execute('DELETE FROM completions')
+                self.db.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                'hits': self.hits,
+                'memory_hits': self.memory_hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'memory_entries': len(self._memory),
+                'ttl_seconds': self.ttl
+            }
+            if self.db is not None:
+                stats['disk_entries'] = self.db.execute('SELECT COUNT(*) FROM completions').fetchone()[0]
+            return stats
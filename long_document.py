@@ -0,0 +1,79 @@
+from token_budget import HEADING, count_tokens
+
+
+class DocumentTooLongError(ValueError):
+    """The document splits into more sections than allowed"""
+
+
+def split_line(line, max_tokens):
+    """Break a line longer than ``max_tokens`` into runs of whole words that each fit"""
+    pieces, words, size = [], [], 0
+    for word in line.split():
+        cost = count_tokens(word) + 1
+        if words and size + cost > max_tokens:
+            pieces.append(' '.join(words))
+            words, size = [], 0
+        words.append(word)
+        size += cost
+    if words:
+        pieces.append(' '.join(words))
+    return pieces
+
+
+def split_sections(lines, max_tokens, max_sections=None):
+    """Split a document, read line by line, into sections of at most ``max_tokens``.
+
+    Sections break before a heading once they are at least half full and
+    otherwise at the last blank line or heading before the limit, so
+    paragraphs stay whole where possible. Only the section being built is
+    held in memory. Raises DocumentTooLongError once more than
+    ``max_sections`` sections have been produced.
+    """
+    section, sizes = [], []
+    size = 0
+    # Index in ``section`` of the last paragraph or heading boundary, where an overfull section is cut
+    boundary = 0
+    count = 0
+
+    def cut(at):
+        nonlocal count, size
+        text = '\n'.join(section[:at]).strip()
+        size -= sum(sizes[:at])
+        del section[:at], sizes[:at]
+        if text:
+            count += 1
+            if max_sections is not None and count > max_sections:
+                raise DocumentTooLongError(f"Document is longer than {max_sections} sections of {max_tokens} tokens")
+        return text
+
+    for raw in lines:
+        raw = raw.rstrip('\r\n')
+        for line in (split_line(raw, max_tokens) if count_tokens(raw) + 1 > max_tokens else [raw]):
+            tokens = count_tokens(line) + 1
+            heading = bool(HEADING.match(line))
+            if section and heading and size >= max_tokens // 2:
+                text = cut(len(section))
+                boundary = 0
+                if text:
+                    yield text
+            elif section and size + tokens > max_tokens:
+                text = cut(boundary or len(section))
+                boundary = 0
+                if text:
+                    yield text
+                # Whatever followed the boundary may still leave no room for this line
+                if section and size + tokens > max_tokens:
+                    text = cut(len(section))
+                    if text:
+                        yield text
+            if heading:
+                boundary = len(section)
+            section.append(line)
+            sizes.append(tokens)
+            size += tokens
+            if not line.strip():
+                boundary = len(section)
+
+    text = cut(len(section))
+    if text:
+        yield text
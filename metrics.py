@@ -0,0 +1,217 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# USD per 1K tokens (prompt, completion); unknown models are costed as gpt-3.5-turbo
+MODEL_PRICES = {
+    'gpt-3.5-turbo': (0.0005, 0.0015),
+    'gpt-4o-mini': (0.00015, 0.0006),
+    'gpt-4o': (0.0025, 0.01)
+}
+
+# Share of the prompt price billed for prompt tokens served from the provider's prompt cache
+CACHED_PROMPT_PRICE = 0.5
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens=0):
+    prompt_price, completion_price = MODEL_PRICES.get(model, MODEL_PRICES['gpt-3.5-turbo'])
+    prompt_cost = (prompt_tokens - cached_tokens * (1 - CACHED_PROMPT_PRICE)) * prompt_price
+    return (prompt_cost + completion_tokens * completion_price) / 1000
+
+
+def cached_tokens(usage):
+    """Prompt tokens of a completion's usage that the provider served from its prompt cache"""
+    return getattr(getattr(usage, 'prompt_tokens_details', None), 'cached_tokens', None) or 0
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.labelnames)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            lines.extend(self._samples())
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {value}' for key, value in self._values.items()]
+
+
+class Gauge(Metric):
+    """A gauge whose value is read from ``function`` at scrape time"""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, function):
+        super().__init__(name, documentation)
+        self.function = function
+
+    def _samples(self):
+        return [f'{self.name} {self.function()}']
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, observations = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self._values[key] = (counts, total + value, observations + 1)
+
+    def _samples(self):
+        lines = []
+        for key, (counts, total, observations) in self._values.items():
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, [("le", bound)])} {count}')
+            lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, [("le", "+Inf")])} {observations}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {observations}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, host='0.0.0.0'):
+    """Serve this process's metrics on their own port from a background thread; returns the server"""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+AGENT_LATENCY = registry.register(Histogram(
+    're_agent_latency_seconds', 'Agent completion latency, including cache lookups',
+    ('agent', 'domain', 'model', 'source')
+))
+AGENT_FIRST_TOKEN = registry.register(Histogram(
+    're_agent_time_to_first_token_seconds', 'Time until a streaming agent call produced its first token',
+    ('agent', 'domain', 'model')
+))
+AGENT_TOKENS = registry.register(Counter(
+    're_agent_tokens_total', 'Tokens reported by response.usage', ('agent', 'domain', 'model', 'type')
+))
+AGENT_COST = registry.register(Counter(
+    're_agent_cost_usd_total', 'Estimated spend from token usage and MODEL_PRICES', ('agent', 'domain', 'model')
+))
+AGENT_CALLS = registry.register(Counter(
+    're_agent_calls_total', 'Agent outputs by how they were obtained', ('agent', 'domain', 'source')
+))
+AGENT_ERRORS = registry.register(Counter(
+    're_agent_errors_total', 'Agent calls that failed', ('agent', 'domain')
+))
+PIPELINE_LATENCY = registry.register(Histogram(
+    're_pipeline_latency_seconds', 'End-to-end pipeline latency per request', ('endpoint', 'domain')
+))
+PIPELINE_REQUESTS = registry.register(Counter(
+    're_pipeline_requests_total',
+    'Pipeline runs by outcome (ok, partial when some agents failed, error, or why the run was cancelled)',
+    ('endpoint', 'outcome')
+))
+CANCELLED_CALLS = registry.register(Counter(
+    're_agent_calls_cancelled_total',
+    'Agent calls dropped because their run was cancelled, before sending (queued) or mid-stream (in_flight)',
+    ('agent', 'reason', 'state')
+))
+CANCELLED_TOKENS = registry.register(Counter(
+    're_cancelled_tokens_total',
+    'Tokens of cancelled calls: billed for an unused answer (wasted) or never generated (saved, estimated)',
+    ('reason', 'kind')
+))
+
+ADMISSION_WAIT = registry.register(Histogram(
+    're_admission_wait_seconds', 'Time requests spent queued for an admission slot', ('endpoint', 'priority')
+))
+ADMISSION_REJECTED = registry.register(Counter(
+    're_admission_rejected_total', 'Requests shed with 429 (queue_full, client_limit or timeout)', ('endpoint', 'reason')
+))
+UPSTREAM_CALLS_SAVED = registry.register(Counter(
+    're_upstream_calls_saved_total',
+    'Agent calls not sent because an identical pipeline run or agent call was already in flight', ('level',)
+))
+
+
+def record_completion(agent, domain, model, seconds, usage=None, source='computed'):
+    AGENT_LATENCY.observe(seconds, agent=agent, domain=domain, model=model, source=source)
+    AGENT_CALLS.inc(agent=agent, domain=domain, source=source)
+    if usage is not None:
+        AGENT_TOKENS.inc(usage.prompt_tokens, agent=agent, domain=domain, model=model, type='prompt')
+        AGENT_TOKENS.inc(usage.completion_tokens, agent=agent, domain=domain, model=model, type='completion')
+        AGENT_TOKENS.inc(cached_tokens(usage), agent=agent, domain=domain, model=model, type='cached_prompt')
+        AGENT_COST.inc(estimate_cost(model, usage.prompt_tokens, usage.completion_tokens, cached_tokens(usage)),
+                       agent=agent, domain=domain, model=model)
+
+
+def record_cancelled(agent, reason, state, wasted, saved):
+    CANCELLED_CALLS.inc(agent=agent, reason=reason, state=state)
+    CANCELLED_TOKENS.inc(wasted, reason=reason, kind='wasted')
+    CANCELLED_TOKENS.inc(saved, reason=reason, kind='saved')
+
+
+def record_pipeline(endpoint, domain, seconds, errors=None, failed=False, cancelled=None):
+    PIPELINE_LATENCY.observe(seconds, endpoint=endpoint, domain=domain)
+    outcome = cancelled or ('error' if failed else 'partial' if errors else 'ok')
+    PIPELINE_REQUESTS.inc(endpoint=endpoint, outcome=outcome)
@@ -0,0 +1,116 @@
+import json
+import math
+import threading
+from collections import deque
+
+DEFAULT_ROUTE = {'model': 'gpt-3.5-turbo', 'temperature': 0.3, 'max_tokens': 800}
+
+
+class AgentRoute:
+    """The model, sampling temperature and completion budget one agent is sent to"""
+
+    def __init__(self, agent, model, max_tokens, temperature, min_tokens=None, max_tokens_limit=None,
+                 response_format=None):
+        self.agent = agent
+        self.model = model
+        self.temperature = temperature
+        # e.g. "json_object" for an agent that must answer in JSON
+        self.response_format = response_format
+        # The configured budget identifies the request in cache keys; ``budget`` is what is sent
+        self.max_tokens = max_tokens
+        self.min_tokens = min_tokens or max_tokens
+        self.max_tokens_limit = max_tokens_limit or max_tokens
+        self.budget = max_tokens
+        self.samples = deque(maxlen=100)
+        self.adjustments = 0
+
+
+class ModelRouter:
+    """Per-agent model and ``max_tokens`` routing, with budgets that adapt to observed completions.
+
+    Agents belong to a tier (e.g. ``validation``) whose model and temperature
+    they inherit unless they set their own. Every ``adjust_every`` completions,
+    once ``min_samples`` have been seen under the current budget, an agent
+    truncated (``finish_reason == 'length'``) more than ``truncation_target``
+    of the time has its budget raised by ``growth``. Otherwise the budget
+    is set to the 95th percentile of its completion lengths times
+    ``headroom``. Budgets stay between each agent's ``min_tokens`` and
+    ``max_tokens_limit``.
+    """
+
+    def __init__(self, config, adaptive=True, min_samples=20, adjust_every=10, truncation_target=0.05,
+                 headroom=1.2, growth=1.25):
+        self.adaptive = adaptive
+        self.min_samples = min_samples
+        self.adjust_every = adjust_every
+        self.truncation_target = truncation_target
+        self.headroom = headroom
+        self.growth = growth
+        self._lock = threading.Lock()
+        tiers = config.get('tiers', {})
+        self.routes = {}
+        for agent, settings in config.get('agents', {}).items():
+            merged = {**DEFAULT_ROUTE, **tiers.get(settings.get('tier'), {}), **settings}
+            self.routes[agent] = AgentRoute(
+                agent, merged['model'], merged['max_tokens'], merged['temperature'],
+                merged.get('min_tokens'), merged.get('max_tokens_limit'), merged.get('response_format')
+            )
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        with open(path) as f:
+            return cls(json.load(f), **kwargs)
+
+    def route(self, agent):
+        if agent not in self.routes:
+            with self._lock:
+                self.routes.setdefault(agent, AgentRoute(
+                    agent, DEFAULT_ROUTE['model'], DEFAULT_ROUTE['max_tokens'], DEFAULT_ROUTE['temperature']
+                ))
+        return self.routes[agent]
+
+    def budget(self, agent):
+        """``max_tokens`` to send for the agent's next call"""
+        route = self.route(agent)
+        return route.budget if self.adaptive else route.max_tokens
+
+    def observe(self, agent, completion_tokens, finish_reason):
+        """Record a completion's length and why it stopped, adjusting the budget when due"""
+        route = self.route(agent)
+        with self._lock:
+            route.samples.append((completion_tokens, finish_reason))
+            if not self.adaptive or len(route.samples) < self.min_samples or len(route.samples) % self.adjust_every:
+                return
+            truncated = sum(1 for _, reason in route.samples if reason == 'length') / len(route.samples)
+            if truncated > self.truncation_target:
+                budget = math.ceil(route.budget * self.growth)
+            else:
+                lengths = sorted(tokens for tokens, _ in route.samples)
+                budget = math.ceil(lengths[math.ceil(0.95 * len(lengths)) - 1] * self.headroom)
+            budget = min(max(budget, route.min_tokens), route.max_tokens_limit)
+            if budget != route.budget:
+                route.budget = budget
+                route.adjustments += 1
+                # Later decisions should only see completions made under the new budget
+                route.samples.clear()
+
+    def stats(self):
+        with self._lock:
+            agents = {}
+            for agent, route in self.routes.items():
+                lengths = sorted(tokens for tokens, _ in route.samples)
+                agents[agent] = {
+                    'model': route.model,
+                    'temperature': route.temperature,
+                    'configured_max_tokens': route.max_tokens,
+                    'max_tokens': route.budget if self.adaptive else route.max_tokens,
+                    'bounds': [route.min_tokens, route.max_tokens_limit],
+                    'adjustments': route.adjustments,
+                    'samples': len(lengths),
+                    'p50_completion_tokens': lengths[len(lengths) // 2] if lengths else None,
+                    'p95_completion_tokens': lengths[math.ceil(0.95 * len(lengths)) - 1] if lengths else None,
+                    'truncation_rate': round(
+                        sum(1 for _, reason in route.samples if reason == 'length') / len(lengths), 4
+                    ) if lengths else 0.0
+                }
+        return {'adaptive': self.adaptive, 'truncation_target': self.truncation_target, 'agents': agents}
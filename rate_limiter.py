@@ -0,0 +1,210 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Lower values are served first
+PRIORITIES = {'interactive': 0, 'batch': 1}
+
+WINDOW_SECONDS = 60.0
+
+# How often a waiting caller's ``check`` runs
+CHECK_INTERVAL = 0.25
+
+
+def estimate_tokens(prompt, max_tokens):
+    """Rough upper bound on the tokens a completion will be billed for (~4 characters per token)"""
+    return len(prompt) // 4 + max_tokens
+
+
+class KeySlot:
+    """One API key's client and its sliding one-minute request/token window"""
+
+    def __init__(self, name, client, rpm, tpm):
+        self.name = name
+        self.client = client
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = deque()
+        self.tokens = deque()  # [timestamp, tokens] pairs, adjusted once actual usage is known
+        self.token_total = 0
+        self.blocked_until = 0.0
+        self.in_flight = 0
+        self.total_requests = 0
+        self.throttled = 0
+
+    def expire(self, now):
+        cutoff = now - WINDOW_SECONDS
+        while self.requests and self.requests[0] <= cutoff:
+            self.requests.popleft()
+        while self.tokens and self.tokens[0][0] <= cutoff:
+            self.token_total -= self.tokens.popleft()[1]
+
+    def wait_time(self, tokens, now):
+        """Seconds until this key can take a request of ``tokens`` tokens"""
+        delay = max(0.0, self.blocked_until - now)
+        if len(self.requests) >= self.rpm:
+            delay = max(delay, self.requests[len(self.requests) - self.rpm] + WINDOW_SECONDS - now)
+        excess = self.token_total + min(tokens, self.tpm) - self.tpm
+        if excess > 0:
+            for timestamp, used in self.tokens:
+                excess -= used
+                if excess <= 0:
+                    delay = max(delay, timestamp + WINDOW_SECONDS - now)
+                    break
+        return delay
+
+    def reserve(self, tokens, now):
+        self.requests.append(now)
+        entry = [now, tokens]
+        self.tokens.append(entry)
+        self.token_total += tokens
+        self.total_requests += 1
+        return entry
+
+    def stats(self, now):
+        self.expire(now)
+        return {
+            'key': self.name,
+            'requests_last_minute': len(self.requests),
+            'tokens_last_minute': self.token_total,
+            'rpm_utilisation': round(len(self.requests) / self.rpm, 4),
+            'tpm_utilisation': round(self.token_total / self.tpm, 4),
+            'in_flight': self.in_flight,
+            'total_requests': self.total_requests,
+            'throttled': self.throttled,
+            'blocked_for_seconds': round(max(0.0, self.blocked_until - now), 3)
+        }
+
+
+class Lease:
+    """A reserved request slot on one key; report actual usage through ``record_usage``"""
+
+    def __init__(self, pool, slot, entry):
+        self.pool = pool
+        self.slot = slot
+        self.entry = entry
+        self.client = slot.client
+
+    def record_usage(self, usage):
+        if usage is not None:
+            self.pool.adjust(self.slot, self.entry, usage.total_tokens)
+
+
+class ClientPool:
+    """Schedules completion calls across a pool of API keys within their RPM/TPM quotas.
+
+    Callers wait in a priority queue (interactive before batch, then first come
+    first served) until some key has room for the request's estimated tokens.
+    The least utilised key with room is picked. A 429 from upstream puts that
+    key on hold for the Retry-After period.
+    """
+
+    def __init__(self, clients, rpm=3500, tpm=90000, retry_after=1.0):
+        self.slots = [KeySlot(name, client, rpm, tpm) for name, client in clients]
+        self.retry_after = retry_after
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._sequence = itertools.count()
+        self.waits = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _pick(self, tokens, now):
+        best, best_delay = None, None
+        for slot in self.slots:
+            slot.expire(now)
+            delay = slot.wait_time(tokens, now)
+            if best is None or (delay, slot.token_total / slot.tpm) < (best_delay, best.token_total / best.tpm):
+                best, best_delay = slot, delay
+        return best, best_delay
+
+    def acquire(self, tokens, priority='interactive', check=None):
+        """Wait for a key with room for ``tokens``; ``check()`` is called while waiting and may raise to give up"""
+        ticket = (PRIORITIES.get(priority, PRIORITIES['batch']), next(self._sequence))
+        started = time.time()
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    if check is not None:
+                        check()
+                    delay = None
+                    if self._waiting[0] == ticket:
+                        now = time.time()
+                        slot, delay = self._pick(tokens, now)
+                        if delay <= 0:
+                            break
+                    if check is not None:
+                        delay = CHECK_INTERVAL if delay is None else min(delay, CHECK_INTERVAL)
+                    self._cond.wait(timeout=delay)
+            except BaseException:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+                raise
+            heapq.heappop(self._waiting)
+            entry = slot.reserve(tokens, now)
+            slot.in_flight += 1
+            waited = now - started
+            self.waits += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            self._cond.notify_all()
+        return Lease(self, slot, entry)
+
+    def release(self, lease, error=None):
+        with self._cond:
+            lease.slot.in_flight -= 1
+            if getattr(error, 'status_code', None) == 429:
+                lease.slot.throttled += 1
+                lease.slot.blocked_until = max(lease.slot.blocked_until, time.time() + self._retry_after(error))
+            self._cond.notify_all()
+
+    def adjust(self, slot, entry, tokens):
+        """Replace a reservation's estimated tokens with the actual usage"""
+        with self._cond:
+            if any(pending is entry for pending in slot.tokens):
+                slot.token_total += tokens - entry[1]
+            entry[1] = tokens
+            self._cond.notify_all()
+
+    def _retry_after(self, error):
+        response = getattr(error, 'response', None)
+        try:
+            return float(response.headers.get('retry-after'))
+        except (AttributeError, TypeError, ValueError):
+            return self.retry_after
+
+    @contextmanager
+    def lease(self, tokens, priority='interactive', check=None):
+        lease = self.acquire(tokens, priority, check)
+        error = None
+        try:
+            yield lease
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.release(lease, error)
+
+    def stats(self):
+        with self._cond:
+            now = time.time()
+            waiting = {name: 0 for name in PRIORITIES}
+            for rank, _ in self._waiting:
+                for name, value in PRIORITIES.items():
+                    if value == rank:
+                        waiting[name] += 1
+            return {
+                'queue_depth': len(self._waiting),
+                'waiting': waiting,
+                'wait_seconds': {
+                    'count': self.waits,
+                    'average': round(self.total_wait / self.waits, 4) if self.waits else 0.0,
+                    'max': round(self.max_wait, 4)
+                },
+                'keys': [slot.stats(now) for slot in self.slots]
+            }
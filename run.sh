@@ -14,6 +14,6 @@ if [ ! -f ".env" ]; then
     exit 1
 fi
 
-# Activate virtual environment and run app
+# Activate virtual environment and run the production server (python app.py for the debug server)
 source venv/bin/activate
-python app.py
+python serve.py
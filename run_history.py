@@ -0,0 +1,140 @@
+import base64
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+import sqlite_offload
+
+PREVIEW_LENGTH = 200
+EXPORT_BATCH_SIZE = 200
+
+# Summary columns returned by listings; the full record is only decompressed by get() and export()
+SUMMARY_COLUMNS = (
+    'id, created_at, endpoint, domain, preview, duration_seconds, prompt_tokens, completion_tokens, '
+    'cost_usd, error_count, stored_bytes, raw_bytes'
+)
+
+
+def encode_cursor(created_at, run_id):
+    return base64.urlsafe_b64encode(json.dumps([created_at, run_id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, run_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(created_at), str(run_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+
+class RunHistory:
+    """Every processed run, kept in SQLite with its record stored as zlib-compressed JSON.
+
+    Listings read only the indexed summary columns and page with an opaque
+    cursor over (created_at, id), newest first, so deep pages cost the same
+    as the first. ``get`` decompresses a single record and ``export``
+    streams records in fixed-size batches without holding the whole history.
+    """
+
+    def __init__(self, path, compression_level=6, journal_mode='wal'):
+        self.compression_level = compression_level
+        self._lock = threading.Lock()
+        self.db = sqlite_offload.connect(path, journal_mode, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS runs ('
+            'id TEXT PRIMARY KEY, created_at REAL NOT NULL, endpoint TEXT, domain TEXT NOT NULL, preview TEXT, '
+            'duration_seconds REAL, prompt_tokens INTEGER, completion_tokens INTEGER, cost_usd REAL, '
+            'error_count INTEGER NOT NULL DEFAULT 0, stored_bytes INTEGER, raw_bytes INTEGER, record BLOB NOT NULL)'
+        )
+        self.db.execute('CREATE INDEX IF NOT EXISTS runs_created ON runs (created_at, id)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS runs_domain_created ON runs (domain, created_at, id)')
+        self.db.commit()
+
+    def add(self, run_id, record, endpoint=None):
+        """Store ``record``: a JSON-serialisable dict with requirement, domain, agents, sections, timings and usage"""
+        raw = json.dumps(record, ensure_ascii=False).encode('utf-8')
+        blob = zlib.compress(raw, self.compression_level)
+        usage = record.get('usage') or {}
+        with self._lock:
+            self.db.execute(
+                'INSERT OR REPLACE INTO runs (id, created_at, endpoint, domain, preview, duration_seconds, '
+                'prompt_tokens, completion_tokens, cost_usd, error_count, stored_bytes, raw_bytes, record) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (
+                    run_id, record.get('created_at', time.time()), endpoint, record.get('domain') or 'general',
+                    record.get('requirement', '')[:PREVIEW_LENGTH], record.get('duration_seconds'),
+                    usage.get('prompt_tokens'), usage.get('completion_tokens'), usage.get('estimated_cost_usd'),
+                    len(record.get('errors') or {}), len(blob), len(raw), blob
+                )
+            )
+            self.db.commit()
+
+    def _filters(self, domain=None, since=None, until=None, cursor=None):
+        clauses, params = [], []
+        if domain:
+            clauses.append('domain = ?')
+            params.append(domain)
+        if since is not None:
+            clauses.append('created_at >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('created_at < ?')
+            params.append(until)
+        if cursor is not None:
+            clauses.append('(created_at, id) < (?, ?)')
+            params.extend(cursor)
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+    def list(self, limit=50, cursor=None, domain=None, since=None, until=None):
+        """One page of run summaries, newest first, and the cursor for the next page (None at the end)"""
+        where, params = self._filters(domain, since, until, decode_cursor(cursor) if cursor else None)
+        with self._lock:
+            rows = self.db.execute(
+                f'SELECT {SUMMARY_COLUMNS} FROM runs{where} ORDER BY created_at DESC, id DESC LIMIT ?',
+                params + [limit + 1]
+            ).fetchall()
+        runs = [dict(row) for row in rows[:limit]]
+        next_cursor = encode_cursor(rows[limit - 1]['created_at'], rows[limit - 1]['id']) if len(rows) > limit else None
+        return runs, next_cursor
+
+    def _decode(self, row):
+        run = json.loads(zlib.decompress(row['record']))
+        run['run_id'] = row['id']
+        return run
+
+    def get(self, run_id):
+        with self._lock:
+            row = self.db.execute('SELECT id, record FROM runs WHERE id = ?', (run_id,)).fetchone()
+        return self._decode(row) if row is not None else None
+
+    def export(self, domain=None, since=None, until=None, batch_size=EXPORT_BATCH_SIZE):
+        """Yield every matching run as a full record, newest first, ``batch_size`` rows at a time"""
+        cursor = None
+        while True:
+            where, params = self._filters(domain, since, until, cursor)
+            with self._lock:
+                rows = self.db.execute(
+                    f'SELECT id, created_at, record FROM runs{where} ORDER BY created_at DESC, id DESC LIMIT ?',
+                    params + [batch_size]
+                ).fetchall()
+            for row in rows:
+                yield self._decode(row)
+            if len(rows) < batch_size:
+                return
+            cursor = (rows[-1]['created_at'], rows[-1]['id'])
+
+    def stats(self):
+        with self._lock:
+            row = self.db.execute(
+                'SELECT COUNT(*) AS runs, COALESCE(SUM(stored_bytes), 0) AS stored, COALESCE(SUM(raw_bytes), 0) AS raw '
+                'FROM runs'
+            ).fetchone()
+        return {
+            'runs': row['runs'],
+            'stored_bytes': row['stored'],
+            'uncompressed_bytes': row['raw'],
+            'compression_ratio': round(row['raw'] / row['stored'], 2) if row['stored'] else None
+        }
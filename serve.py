@@ -0,0 +1,105 @@
+"""Production server for the web interface and API.
+
+Usage:
+    python serve.py --bind 0.0.0.0:5001
+    python serve.py --workers 4 --metrics-port 9100
+
+Runs gunicorn with a single process by default. Metrics, caches, in-flight
+coalescing and the cancellation watchdog live in process memory, so one
+process sees and shares all of them. Each process uses gevent workers by
+default, so the agents' network calls yield to other requests instead of
+holding a thread, and SQLite calls run on gevent's threadpool (see
+sqlite_offload.py). Pass --worker-class gthread where gevent isn't installed.
+
+With --workers N, the rate limits and admission limits are split between
+the processes. Identical requests are only coalesced within a process.
+Every process then exports its own metrics on --metrics-port + its index,
+since scrapes of the shared port would reach a different process each time.
+"""
+import argparse
+import itertools
+import os
+
+from gunicorn.app.base import BaseApplication
+
+WEB_WORKERS = int(os.getenv('WEB_WORKERS', '1'))
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+WEB_WORKER_CLASS = os.getenv('WEB_WORKER_CLASS', 'gevent')
+WEB_WORKER_CONNECTIONS = int(os.getenv('WEB_WORKER_CONNECTIONS', '500'))
+WEB_THREADS = int(os.getenv('WEB_THREADS', '32'))
+# Agent calls in flight per process; cheap under gevent, so much higher than the development default
+WEB_AGENT_CONCURRENCY = os.getenv('WEB_AGENT_CONCURRENCY', '256')
+
+
+def assign_metrics_index(server, worker):
+    """Runs in the master before each fork: the lowest free index, so a restarted process reuses its port"""
+    taken = {getattr(other, 'metrics_index', None) for other in server.WORKERS.values()}
+    worker.metrics_index = next(index for index in itertools.count() if index not in taken)
+
+
+def metrics_listener(port):
+    def post_worker_init(worker):
+        # After the worker has loaded the app (and gevent has patched the standard library)
+        import metrics
+        metrics.serve(port + worker.metrics_index)
+    return post_worker_init
+
+
+class Server(BaseApplication):
+    def __init__(self, options, job_workers):
+        self.options = options
+        self.job_workers = job_workers
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        # Imported here so each worker process builds its own clients, pools and database connections
+        from app import create_app
+        return create_app(job_workers=self.job_workers)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the requirement engineering tool.')
+    parser.add_argument('-b', '--bind', default=os.getenv('WEB_BIND', '0.0.0.0:5001'))
+    parser.add_argument('-w', '--workers', type=int, default=WEB_WORKERS,
+                        help='server processes (default: %(default)s)')
+    parser.add_argument('-k', '--worker-class', choices=('gevent', 'gthread'), default=WEB_WORKER_CLASS,
+                        help='gevent: cooperative I/O; gthread: a thread per request (default: %(default)s)')
+    parser.add_argument('--worker-connections', type=int, default=WEB_WORKER_CONNECTIONS,
+                        help='concurrent requests per gevent process (default: %(default)s)')
+    parser.add_argument('--threads', type=int, default=WEB_THREADS,
+                        help='concurrent requests per gthread process (default: %(default)s)')
+    parser.add_argument('--job-threads', type=int, default=int(os.getenv('JOB_WORKER_THREADS', '2')),
+                        help='job queue workers per process; 0 leaves jobs to worker.py (default: %(default)s)')
+    parser.add_argument('--metrics-port', type=int, default=METRICS_PORT,
+                        help='serve process i\'s /metrics on this port + i; 0 disables (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    # Read by app.py when each worker imports it
+    os.environ['SERVER_PROCESSES'] = str(args.workers)
+    if args.worker_class == 'gevent':
+        os.environ.setdefault('AGENT_CONCURRENCY', WEB_AGENT_CONCURRENCY)
+
+    options = {
+        'bind': args.bind,
+        'workers': args.workers,
+        'worker_class': args.worker_class,
+        'worker_connections': args.worker_connections,
+        'threads': args.threads,
+        # Event streams and full pipeline runs outlive the default 30s; let them finish on shutdown
+        'timeout': 120,
+        'graceful_timeout': 120,
+        'keepalive': 5,
+        'accesslog': '-'
+    }
+    if args.metrics_port:
+        options['pre_fork'] = assign_metrics_index
+        options['post_worker_init'] = metrics_listener(args.metrics_port)
+    Server(options, args.job_threads).run()
+
+
+if __name__ == '__main__':
+    main()
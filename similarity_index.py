@@ -0,0 +1,178 @@
+import hashlib
+import re
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+import sqlite_offload
+
+WORD = re.compile(r'\w+')
+EMPTY = (1 << 64) - 1
+
+
+def shingles(text, size=3):
+    """Overlapping word ``size``-grams of the normalised text"""
+    words = WORD.findall(text.lower())
+    if len(words) < size:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[index:index + size]) for index in range(len(words) - size + 1)}
+
+
+def minhash(text, num_hashes=64):
+    """One-permutation MinHash signature of ``text``, or None if it has no words.
+
+    Each shingle is hashed once and lands in one of ``num_hashes`` bins, whose
+    minimum is kept, so a signature costs O(shingles) rather than
+    O(shingles * num_hashes). Empty bins borrow the next filled bin's value
+    (rotation densification) so signatures of short texts stay comparable.
+    """
+    signature = [EMPTY] * num_hashes
+    for shingle in shingles(text):
+        value = int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little')
+        slot, value = value % num_hashes, value // num_hashes
+        if value < signature[slot]:
+            signature[slot] = value
+    filled = [slot for slot, value in enumerate(signature) if value != EMPTY]
+    if not filled:
+        return None
+    for slot in range(num_hashes):
+        distance = 0
+        while signature[(slot + distance) % num_hashes] == EMPTY:
+            distance += 1
+        if distance:
+            signature[slot] = signature[(slot + distance) % num_hashes] + distance * (EMPTY // num_hashes // 64)
+    return array('Q', signature)
+
+
+def similarity(first, second):
+    """Estimated Jaccard similarity of the shingle sets behind two signatures"""
+    return sum(1 for a, b in zip(first, second) if a == b) / len(first)
+
+
+class SimilarityIndex:
+    """Persistent MinHash LSH index of processed requirements, partitioned by domain.
+
+    Signatures are split into ``bands``; two requirements become candidates
+    when any band matches exactly, and candidates are then scored on their
+    full signatures. With 64 hashes in 16 bands of 4, pairs above 0.7
+    similarity become candidates with over 99% probability, and a lookup only
+    touches 16 buckets however many requirements are stored. Signatures
+    live in SQLite and the buckets are rebuilt in memory on start-up.
+    """
+
+    def __init__(self, path=None, num_hashes=64, bands=16, max_entries=50000, journal_mode='wal'):
+        if num_hashes % bands:
+            raise ValueError('num_hashes must be a multiple of bands')
+        self.num_hashes = num_hashes
+        self.bands = bands
+        self.rows = num_hashes // bands
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # run_id -> (domain, signature), oldest first
+        self._buckets = {}  # hash of (domain, band, band values) -> run_id, or a list of them
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.matches = 0
+        self.db = None
+        if path:
+            self.db = sqlite_offload.connect(path, journal_mode, check_same_thread=False)
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS requirements ('
+                'run_id TEXT PRIMARY KEY, domain TEXT NOT NULL, signature BLOB NOT NULL, created_at REAL NOT NULL)'
+            )
+            self.db.commit()
+            rows = self.db.execute('SELECT run_id, domain, signature FROM requirements ORDER BY created_at').fetchall()
+            for run_id, domain, blob in rows:
+                signature = array('Q')
+                signature.frombytes(blob)
+                if len(signature) == num_hashes:
+                    self._insert(run_id, domain, signature)
+
+    def _band_keys(self, domain, signature):
+        # Buckets are rebuilt on start-up, so per-process string hashing is fine here
+        return [hash((domain, band) + tuple(signature[band * self.rows:(band + 1) * self.rows]))
+                for band in range(self.bands)]
+
+    def _insert(self, run_id, domain, signature):
+        self._entries[run_id] = (domain, signature)
+        for key in self._band_keys(domain, signature):
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                self._buckets[key] = run_id
+            elif isinstance(bucket, list):
+                bucket.append(run_id)
+            else:
+                self._buckets[key] = [bucket, run_id]
+
+    def _discard(self, run_id):
+        domain, signature = self._entries.pop(run_id)
+        for key in self._band_keys(domain, signature):
+            bucket = self._buckets.get(key)
+            if bucket == run_id:
+                del self._buckets[key]
+            elif isinstance(bucket, list) and run_id in bucket:
+                bucket.remove(run_id)
+                if len(bucket) == 1:
+                    self._buckets[key] = bucket[0]
+
+    def add(self, run_id, requirement, domain):
+        signature = minhash(requirement, self.num_hashes)
+        if signature is None:
+            return
+        with self._lock:
+            if run_id in self._entries:
+                self._discard(run_id)
+            self._insert(run_id, domain, signature)
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._discard(oldest)
+                evicted.append((oldest,))
+            if self.db is not None:
+                self.db.execute(
+                    'INSERT OR REPLACE INTO requirements (run_id, domain, signature, created_at) VALUES (?, ?, ?, ?)',
+                    (run_id, domain, signature.tobytes(), time.time())
+                )
+                self.db.executemany('DELETE FROM requirements WHERE run_id = ?', evicted)
+                self.db.commit()
+
+    def remove(self, run_id):
+        with self._lock:
+            if run_id in self._entries:
+                self._discard(run_id)
+            if self.db is not None:
+                self.db.execute('DELETE FROM requirements WHERE run_id = ?', (run_id,))
+                self.db.commit()
+
+    def lookup(self, requirement, domain, threshold=0.85):
+        """The most similar stored requirement in ``domain`` as ``(run_id, similarity)``, or None"""
+        signature = minhash(requirement, self.num_hashes)
+        if signature is None:
+            return None
+        with self._lock:
+            self.lookups += 1
+            candidates = set()
+            for key in self._band_keys(domain, signature):
+                bucket = self._buckets.get(key)
+                if isinstance(bucket, list):
+                    candidates.update(bucket)
+                elif bucket is not None:
+                    candidates.add(bucket)
+            best = None
+            for run_id in candidates:
+                score = similarity(signature, self._entries[run_id][1])
+                if score >= threshold and (best is None or score > best[1]):
+                    best = (run_id, score)
+            if best is not None:
+                self.matches += 1
+            return best
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'buckets': len(self._buckets),
+                'lookups': self.lookups,
+                'matches': self.matches,
+                'match_rate': round(self.matches / self.lookups, 4) if self.lookups else 0.0
+            }
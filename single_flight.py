@@ -0,0 +1,138 @@
+import threading
+
+# How often a waiting follower's ``check`` runs
+CHECK_INTERVAL = 0.25
+
+
+class CancelledFlightError(RuntimeError):
+    """The call a caller was sharing stopped before it finished"""
+
+
+class Flight:
+    def __init__(self):
+        self.parts = []
+        self.result = None
+        self.error = None
+        self.done = False
+        self.condition = threading.Condition()
+
+    def finish(self, error=None):
+        with self.condition:
+            self.error = error
+            self.done = True
+            self.condition.notify_all()
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one.
+
+    The first caller for a key (the leader) runs the call. Callers arriving
+    while it is in flight (followers) wait for it and share its result or
+    exception rather than repeating the work. Once the call finishes, the
+    key is free again, so later callers run their own; results are not cached.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+        self.calls_saved = 0
+
+    def _join(self, key):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = Flight()
+                self.leaders += 1
+                return flight, True
+            self.followers += 1
+            return flight, False
+
+    def _land(self, key, flight, error=None):
+        with self._lock:
+            del self._flights[key]
+        flight.finish(error)
+
+    def do(self, key, function, check=None):
+        """``(result, shared)`` of ``function()``, where ``shared`` is True if another caller's call produced it.
+
+        ``check()`` is called while a follower waits and may raise to stop
+        waiting, e.g. once the follower's own client has gone; the leader's
+        call carries on for everyone else.
+        """
+        key = ('call', key)
+        flight, leader = self._join(key)
+        if not leader:
+            with flight.condition:
+                while not flight.condition.wait_for(lambda: flight.done, CHECK_INTERVAL if check else None):
+                    check()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+        try:
+            flight.result = function()
+        except BaseException as e:
+            self._land(key, flight, e)
+            raise
+        self._land(key, flight)
+        return flight.result, False
+
+    def stream(self, key, function):
+        """``(items, shared)`` for the generator ``function()``.
+
+        Followers replay every item the leader has produced so far and then
+        receive the rest as they arrive. The leader must consume ``items`` to
+        the end (or close it), since followers wait on it.
+        """
+        # Kept apart from do() flights, which share a result rather than items
+        key = ('stream', key)
+        flight, leader = self._join(key)
+        if leader:
+            return self._lead(key, flight, function), False
+        return self._follow(flight), True
+
+    def _lead(self, key, flight, function):
+        error = None
+        try:
+            for item in function():
+                with flight.condition:
+                    flight.parts.append(item)
+                    flight.condition.notify_all()
+                yield item
+        except GeneratorExit:
+            error = CancelledFlightError('The shared call was abandoned before it finished')
+            raise
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._land(key, flight, error)
+
+    def _follow(self, flight):
+        index = 0
+        while True:
+            with flight.condition:
+                flight.condition.wait_for(lambda: flight.done or len(flight.parts) > index)
+                items = flight.parts[index:]
+                done = flight.done
+            index += len(items)
+            yield from items
+            if done:
+                break
+        if flight.error is not None:
+            raise flight.error
+
+    def saved(self, calls=1):
+        """Count upstream calls a follower did not have to make"""
+        with self._lock:
+            self.calls_saved += calls
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': len(self._flights),
+                'leaders': self.leaders,
+                'followers': self.followers,
+                'upstream_calls_saved': self.calls_saved
+            }
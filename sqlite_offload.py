@@ -0,0 +1,83 @@
+import sqlite3
+
+# WAL needs shared memory between the processes using a database, so it only works on a local disk.
+# A database on a network volume shared by several machines needs the rollback journal ("delete")
+JOURNAL_MODES = ('wal', 'delete')
+
+
+def _threadpool():
+    """gevent's native threadpool when the process is monkey-patched, else None"""
+    try:
+        from gevent import get_hub, monkey
+    except ImportError:
+        return None
+    if not monkey.is_module_patched('threading'):
+        return None
+    return get_hub().threadpool
+
+
+def connect(path, journal_mode='wal', **kwargs):
+    """Open an SQLite connection in ``journal_mode`` that does not block the gevent hub.
+
+    A gevent worker runs every request on one OS thread, so a blocking sqlite3
+    call (a busy-lock wait, an fsync) stalls all of them. When the process is
+    monkey-patched, statements run on the hub's threadpool and only the calling
+    greenlet waits; otherwise this is a plain ``sqlite3.connect``. Callers must
+    pass ``check_same_thread=False`` and serialise access themselves, as they
+    already do for threaded servers.
+    """
+    if journal_mode.lower() not in JOURNAL_MODES:
+        raise ValueError(f"journal_mode must be one of {', '.join(JOURNAL_MODES)}")
+    db = sqlite3.connect(path, **kwargs)
+    db.execute(f'PRAGMA journal_mode={journal_mode}')
+    if _threadpool() is None:
+        return db
+    return OffloadedConnection(db)
+
+
+class OffloadedRows:
+    """The rows of an executed statement, fetched on the threadpool"""
+
+    def __init__(self, cursor):
+        self.rowcount = cursor.rowcount
+        self.lastrowid = cursor.lastrowid
+        self._rows = iter(cursor.fetchall())
+
+    def __iter__(self):
+        return self._rows
+
+    def fetchone(self):
+        return next(self._rows, None)
+
+    def fetchall(self):
+        return list(self._rows)
+
+
+class OffloadedConnection:
+    """Wraps a connection so each call runs on gevent's threadpool"""
+
+    def __init__(self, db):
+        self._db = db
+
+    @property
+    def row_factory(self):
+        return self._db.row_factory
+
+    @row_factory.setter
+    def row_factory(self, factory):
+        self._db.row_factory = factory
+
+    def _run(self, fn, *args):
+        return _threadpool().apply(fn, args)
+
+    def execute(self, sql, params=()):
+        return self._run(lambda: OffloadedRows(self._db.execute(sql, params)))
+
+    def executemany(self, sql, params):
+        return self._run(lambda: OffloadedRows(self._db.executemany(sql, params)))
+
+    def commit(self):
+        self._run(self._db.commit)
+
+    def close(self):
+        self._run(self._db.close)
@@ -0,0 +1,156 @@
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected
+
+
+TIMEOUT = 5
+
+
+def wait_for_queued(controller, count, priority='interactive'):
+    deadline = time.monotonic() + TIMEOUT
+    while controller.stats()['queued'][priority] < count:
+        assert time.monotonic() < deadline, 'timed out waiting for requests to queue'
+        time.sleep(0.01)
+
+
+def join(thread):
+    thread.join(TIMEOUT)
+    assert not thread.is_alive()
+
+
+def test_waiting_clients_take_turns():
+    controller = AdmissionController(max_in_flight=1, client_max_in_flight=1)
+    release, _ = controller.acquire('holder')
+    order = []
+
+    def run(client, tag):
+        with controller.admit(client):
+            order.append(tag)
+
+    # A busy client queues three requests before a second client queues one
+    threads = []
+    for tag, client in [('a1', 'a'), ('a2', 'a'), ('a3', 'a'), ('b1', 'b')]:
+        threads.append(threading.Thread(target=run, args=(client, tag)))
+        threads[-1].start()
+        wait_for_queued(controller, len(threads))
+    release()
+    for thread in threads:
+        join(thread)
+
+    assert order == ['a1', 'b1', 'a2', 'a3']
+
+
+def test_interactive_requests_go_before_batch():
+    controller = AdmissionController(max_in_flight=1)
+    release, _ = controller.acquire('holder')
+    order = []
+
+    def run(priority):
+        with controller.admit('client', priority):
+            order.append(priority)
+
+    batch = threading.Thread(target=run, args=('batch',))
+    batch.start()
+    wait_for_queued(controller, 1, 'batch')
+    interactive = threading.Thread(target=run, args=('interactive',))
+    interactive.start()
+    wait_for_queued(controller, 1)
+    release()
+    join(batch)
+    join(interactive)
+
+    assert order == ['interactive', 'batch']
+
+
+def test_client_in_flight_limit_leaves_room_for_others():
+    controller = AdmissionController(max_in_flight=4, client_max_in_flight=1, max_wait=0.1)
+    release, _ = controller.acquire('a')
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire('a')
+    assert rejected.value.reason == 'timeout'
+    other, waited = controller.acquire('b')
+    assert waited < 0.1
+    release()
+    other()
+
+
+def test_full_queue_rejects_at_once():
+    controller = AdmissionController(max_in_flight=1, max_queue=1, max_wait=5)
+    release, _ = controller.acquire('holder')
+    waiter = threading.Thread(target=lambda: controller.acquire('a')[0]())
+    waiter.start()
+    wait_for_queued(controller, 1)
+
+    started = time.perf_counter()
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire('b')
+    assert time.perf_counter() - started < 1
+    assert rejected.value.reason == 'queue_full'
+    assert rejected.value.retry_after >= 1
+
+    release()
+    join(waiter)
+    assert controller.stats()['rejected'] == {'queue_full': 1}
+
+
+def test_client_queue_limit():
+    controller = AdmissionController(max_in_flight=1, client_max_queue=1, max_wait=5)
+    release, _ = controller.acquire('holder')
+    waiter = threading.Thread(target=lambda: controller.acquire('a')[0]())
+    waiter.start()
+    wait_for_queued(controller, 1)
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire('a')
+    assert rejected.value.reason == 'client_limit'
+
+    release()
+    join(waiter)
+
+
+def test_failing_check_withdraws_the_request():
+    controller = AdmissionController(max_in_flight=1)
+    release, _ = controller.acquire('holder')
+    gone = threading.Event()
+
+    def check():
+        if gone.is_set():
+            raise ConnectionError('client went away')
+
+    errors = []
+
+    def run():
+        try:
+            controller.acquire('a', check=check)
+        except ConnectionError as e:
+            errors.append(e)
+
+    waiter = threading.Thread(target=run)
+    waiter.start()
+    wait_for_queued(controller, 1)
+    gone.set()
+    join(waiter)
+
+    assert len(errors) == 1
+    assert controller.stats()['queued']['interactive'] == 0
+    release()
+    assert controller.stats()['in_flight'] == 0
+
+
+def test_release_is_idempotent():
+    controller = AdmissionController(max_in_flight=1)
+    release, _ = controller.acquire('a')
+    release()
+    release()
+    assert controller.stats()['in_flight'] == 0
+    controller.acquire('b')[0]()
+
+
+def test_unknown_priority_is_refused():
+    controller = AdmissionController()
+    with pytest.raises(ValueError):
+        controller.acquire('a', 'made-up-priority')
+    assert controller.stats()['in_flight'] == 0
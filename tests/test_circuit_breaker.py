@@ -0,0 +1,110 @@
+import time
+
+import httpx
+import openai
+import pytest
+
+from cancellation import PipelineCancelled
+from transport import CircuitBreaker, CircuitOpenError, Transport
+
+
+def connection_error():
+    return openai.APIConnectionError(request=httpx.Request('POST', 'https://api.openai.com/v1/chat/completions'))
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.before_call()
+    breaker.record_failure()
+
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert breaker.stats()['rejected_calls'] == 1
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+
+
+def test_half_open_lets_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.1)
+    breaker.record_failure()
+    time.sleep(0.15)
+
+    breaker.before_call()
+    assert breaker.state == 'half_open'
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_trial_success_closes_the_circuit():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.1)
+    breaker.record_failure()
+    time.sleep(0.15)
+    breaker.before_call()
+    breaker.record_success()
+
+    assert breaker.state == 'closed'
+    breaker.before_call()
+    breaker.before_call()
+
+
+def test_trial_failure_reopens_the_circuit():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.1)
+    breaker.record_failure()
+    time.sleep(0.15)
+    breaker.before_call()
+    breaker.record_failure()
+
+    assert breaker.state == 'open'
+    assert breaker.stats()['times_opened'] == 2
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_cancelled_trial_lets_another_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.1)
+    breaker.record_failure()
+    time.sleep(0.15)
+    breaker.before_call()
+    breaker.record_cancelled()
+
+    assert breaker.state == 'half_open'
+    breaker.before_call()
+
+
+def test_transport_fails_fast_while_open():
+    transport = Transport(max_retries=0, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=30))
+    calls = []
+
+    def failing(timeout):
+        calls.append(timeout)
+        raise connection_error()
+
+    for _ in range(2):
+        with pytest.raises(openai.APIConnectionError):
+            transport.call('analyst', failing)
+    with pytest.raises(CircuitOpenError):
+        transport.call('analyst', failing)
+    assert len(calls) == 2
+
+
+def test_transport_cancellation_is_not_a_failure():
+    transport = Transport(max_retries=0, breaker=CircuitBreaker(failure_threshold=1))
+
+    def cancelled(timeout):
+        raise PipelineCancelled('deadline')
+
+    with pytest.raises(PipelineCancelled):
+        transport.call('analyst', cancelled)
+    assert transport.breaker.state == 'closed'
+    assert transport.call('analyst', lambda timeout: 'ok') == 'ok'
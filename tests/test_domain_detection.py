@@ -0,0 +1,57 @@
+import json
+import os
+
+import pytest
+
+from domain_detection import DEFAULT_DOMAIN, DomainDetector
+
+KEYWORDS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'domain_keywords.json')
+
+
+@pytest.fixture(scope='module')
+def detector():
+    return DomainDetector.from_file(KEYWORDS_PATH)
+
+
+def test_keywords_match_whole_words_only(detector):
+    result = detector.detect('Show a border around the sidebar')
+    assert result['domain'] == DEFAULT_DOMAIN
+    assert result['matched_keywords'] == {}
+
+
+def test_plurals_and_multi_word_keywords(detector):
+    result = detector.detect('Export orders and the patient\'s  Medical\nRecords')
+    assert result['matched_keywords'] == {'order': 1, 'patient': 1, 'medical records': 1}
+    assert result['domain'] == 'healthcare'
+
+
+def test_shared_keyword_counts_for_every_domain(detector):
+    result = detector.detect('Accept a payment')
+    assert result['scores']['ecommerce'] == result['scores']['fintech'] == 1
+    assert {entry['domain'] for entry in result['domains']} == {'ecommerce', 'fintech'}
+
+
+def test_other_fintech_signal_decides_a_payment(detector):
+    result = detector.detect('Accept a payment from the customer wallet and record the transaction')
+    assert result['domain'] == 'fintech'
+    assert result['confidence'] == pytest.approx(3 / 4)
+
+
+def test_config_defined_domain(tmp_path):
+    path = tmp_path / 'domains.json'
+    path.write_text(json.dumps({
+        'logistics': {'keywords': {'warehouse': 2, 'fleet': 2, 'delivery route': 3}},
+        'ecommerce': {'keywords': {'order': 1}}
+    }))
+    detector = DomainDetector.from_file(str(path))
+
+    result = detector.detect('Plan the delivery route for each order leaving the warehouse')
+    assert result['domain'] == 'logistics'
+    assert result['scores'] == {'logistics': 5, 'ecommerce': 1}
+    assert [entry['domain'] for entry in result['domains']] == ['logistics']
+
+
+def test_below_min_score_is_general():
+    detector = DomainDetector({'ecommerce': {'keywords': {'shop': 1}}}, min_score=2)
+    assert detector.detect('Open the shop')['domain'] == DEFAULT_DOMAIN
+    assert DomainDetector({}).detect('Open the shop')['domain'] == DEFAULT_DOMAIN
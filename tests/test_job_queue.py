@@ -0,0 +1,124 @@
+import threading
+import time
+
+import pytest
+
+from job_queue import JobQueue, work
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / 'jobs.sqlite3'), lease_seconds=0.2, max_attempts=2)
+
+
+def test_jobs_are_claimed_oldest_first(queue):
+    first = queue.enqueue('first', {'bypass_cache': True})
+    second = queue.enqueue('second')
+
+    job = queue.claim('w1')
+    assert job['id'] == first
+    assert job['options'] == {'bypass_cache': True}
+    assert job['status'] == 'running' and job['attempts'] == 1
+    assert queue.claim('w2')['id'] == second
+    assert queue.claim('w3') is None
+
+
+def test_expired_lease_hands_the_job_to_another_worker(queue):
+    job_id = queue.enqueue('requirement')
+    queue.claim('w1')
+    assert queue.claim('w2') is None
+
+    time.sleep(0.25)
+    job = queue.claim('w2')
+    assert job['id'] == job_id and job['worker'] == 'w2' and job['attempts'] == 2
+
+    # The first worker lost its lease, so its late result is ignored
+    assert not queue.heartbeat(job_id, 'w1')
+    queue.complete(job_id, 'w1', {'from': 'w1'})
+    queue.complete(job_id, 'w2', {'from': 'w2'})
+    assert queue.get(job_id)['result'] == {'from': 'w2'}
+
+
+def test_heartbeat_keeps_the_lease(queue):
+    queue.enqueue('requirement')
+    job = queue.claim('w1')
+    for _ in range(3):
+        time.sleep(0.1)
+        assert queue.heartbeat(job['id'], 'w1')
+    assert queue.claim('w2') is None
+
+
+def test_lease_expiring_on_the_last_attempt_fails_the_job(queue):
+    job_id = queue.enqueue('requirement')
+    queue.claim('w1')
+    time.sleep(0.25)
+    queue.claim('w2')
+    time.sleep(0.25)
+
+    assert queue.claim('w3') is None
+    job = queue.get(job_id)
+    assert job['status'] == 'failed'
+    assert job['error'] == 'Worker lease expired too many times'
+
+
+def test_failed_attempts_are_retried_until_max_attempts(queue):
+    job_id = queue.enqueue('requirement')
+    queue.fail(job_id, queue.claim('w1')['worker'], 'boom')
+    job = queue.get(job_id)
+    assert job['status'] == 'queued' and job['error'] == 'boom' and job['finished_at'] is None
+
+    queue.fail(job_id, queue.claim('w2')['worker'], 'boom again')
+    job = queue.get(job_id)
+    assert job['status'] == 'failed' and job['error'] == 'boom again' and job['finished_at'] is not None
+    assert queue.claim('w3') is None
+
+
+def test_cancel(queue):
+    queued = queue.enqueue('queued')
+    running = queue.enqueue('running')
+    queue.claim('w1')
+    queue.claim('w1')
+
+    assert queue.cancel(queued)
+    assert queue.cancel(running)
+    assert not queue.cancel(running)
+    assert queue.get(running)['status'] == 'cancelled'
+    # A worker finishing a cancelled job doesn't overwrite its status
+    queue.complete(running, 'w1', {'result': True})
+    assert queue.get(running)['status'] == 'cancelled'
+    assert queue.stats() == {'cancelled': 2}
+
+
+def test_liveness_tracks_polls(queue):
+    job_id = queue.enqueue('requirement')
+    time.sleep(0.1)
+    status, idle = queue.liveness(job_id)
+    assert status == 'queued' and idle >= 0.1
+    queue.touch(job_id)
+    assert queue.liveness(job_id)[1] < 0.1
+    assert queue.liveness('unknown') is None
+
+
+def test_work_retries_a_failing_handler(queue):
+    job_id = queue.enqueue('requirement')
+    attempts = []
+    stop = threading.Event()
+
+    def handler(job, queue):
+        attempts.append(job['attempts'])
+        if len(attempts) == 1:
+            raise RuntimeError('transient')
+        stop.set()
+        return {'ok': True}
+
+    work(queue, handler, worker='w1', stop=stop, poll_interval=0.01)
+
+    assert attempts == [1, 2]
+    job = queue.get(job_id)
+    assert job['status'] == 'completed' and job['result'] == {'ok': True}
+
+
+def test_journal_mode_is_validated(tmp_path):
+    with pytest.raises(ValueError):
+        JobQueue(str(tmp_path / 'jobs.sqlite3'), journal_mode='memory')
+    JobQueue(str(tmp_path / 'jobs.sqlite3'), journal_mode='delete')
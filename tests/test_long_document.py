@@ -0,0 +1,76 @@
+import pytest
+
+from long_document import DocumentTooLongError, split_sections
+from token_budget import count_tokens
+
+
+def paragraph(label, sentences=8):
+    return ' '.join(f"The system shall record {label} event number {index}." for index in range(sentences))
+
+
+def section_tokens(section):
+    return sum(count_tokens(line) + 1 for line in section.split('\n'))
+
+
+def document(*blocks):
+    return '\n'.join(blocks).splitlines(keepends=True)
+
+
+def test_sections_fit_and_keep_every_word():
+    lines = document(*(block for index in range(12) for block in (paragraph(f"p{index}"), '')))
+    sections = list(split_sections(lines, max_tokens=300))
+
+    assert len(sections) > 1
+    assert all(section_tokens(section) <= 300 for section in sections)
+    assert ' '.join(sections).split() == ''.join(lines).split()
+
+
+def test_paragraphs_stay_whole():
+    paragraphs = [paragraph(f"p{index}") for index in range(6)]
+    lines = document(*(block for text in paragraphs for block in (text, '')))
+    sections = list(split_sections(lines, max_tokens=section_tokens(paragraphs[0]) * 3))
+
+    for section in sections:
+        assert [text for text in section.split('\n') if text] == [text for text in paragraphs if text in section]
+
+
+def test_breaks_before_a_heading_once_half_full():
+    intro = paragraph('intro', 6)
+    limit = section_tokens(intro) * 3 // 2
+    sections = list(split_sections(document(intro, '## Next', paragraph('next', 2)), max_tokens=limit))
+
+    assert sections[0] == intro
+    assert sections[1].startswith('## Next')
+
+
+def test_long_line_is_split_at_words():
+    line = paragraph('long', 40)
+    sections = list(split_sections([line], max_tokens=50))
+
+    assert len(sections) > 1
+    assert all(section_tokens(section) <= 50 for section in sections)
+    assert ' '.join(sections).split() == line.split()
+
+
+def test_blank_document_has_no_sections():
+    assert list(split_sections(['\n', '   \n', ''], max_tokens=100)) == []
+
+
+def test_too_many_sections():
+    lines = document(*(block for index in range(10) for block in (paragraph(f"p{index}"), '')))
+    with pytest.raises(DocumentTooLongError):
+        list(split_sections(lines, max_tokens=100, max_sections=2))
+
+
+def test_reads_lines_as_sections_are_consumed():
+    read = []
+
+    def lines():
+        for index in range(200):
+            read.append(index)
+            yield paragraph(f"p{index}", 2) + '\n'
+            yield '\n'
+
+    sections = split_sections(lines(), max_tokens=200)
+    next(sections)
+    assert len(read) < 20
@@ -0,0 +1,96 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import rate_limiter
+from rate_limiter import ClientPool
+
+TIMEOUT = 5
+
+
+@pytest.fixture(autouse=True)
+def short_window(monkeypatch):
+    # Quotas are per minute; a short window keeps the waits in the tests brief
+    monkeypatch.setattr(rate_limiter, 'WINDOW_SECONDS', 0.3)
+
+
+def timed_acquire(pool, tokens, priority='interactive'):
+    started = time.perf_counter()
+    lease = pool.acquire(tokens, priority)
+    pool.release(lease)
+    return lease, time.perf_counter() - started
+
+
+def join(thread):
+    thread.join(TIMEOUT)
+    assert not thread.is_alive()
+
+
+def test_rpm_limit_waits_for_the_window():
+    pool = ClientPool([('key-1', 'client')], rpm=2, tpm=10000)
+    assert timed_acquire(pool, 10)[1] < 0.1
+    assert timed_acquire(pool, 10)[1] < 0.1
+    assert 0.2 < timed_acquire(pool, 10)[1] < 1
+
+
+def test_tpm_limit_waits_for_the_window():
+    pool = ClientPool([('key-1', 'client')], rpm=100, tpm=100)
+    assert timed_acquire(pool, 60)[1] < 0.1
+    assert 0.2 < timed_acquire(pool, 60)[1] < 1
+
+
+def test_actual_usage_frees_the_estimate():
+    pool = ClientPool([('key-1', 'client')], rpm=100, tpm=100)
+    lease = pool.acquire(60)
+    lease.record_usage(SimpleNamespace(total_tokens=10))
+    pool.release(lease)
+    assert timed_acquire(pool, 60)[1] < 0.1
+
+
+def test_calls_go_to_the_least_utilised_key():
+    pool = ClientPool([('key-1', 'a'), ('key-2', 'b')], rpm=100, tpm=1000)
+    first, _ = timed_acquire(pool, 100)
+    second, _ = timed_acquire(pool, 10)
+    assert {first.client, second.client} == {'a', 'b'}
+    # key-2 has used fewer tokens
+    assert timed_acquire(pool, 10)[0].client == second.client
+
+
+def test_429_puts_the_key_on_hold():
+    pool = ClientPool([('key-1', 'a'), ('key-2', 'b')], rpm=100, tpm=1000)
+    lease = pool.acquire(10)
+    error = SimpleNamespace(status_code=429, response=SimpleNamespace(headers={'retry-after': '30'}))
+    pool.release(lease, error)
+    assert all(timed_acquire(pool, 10)[0].client != lease.client for _ in range(3))
+    held = next(key for key in pool.stats()['keys'] if key['throttled'])
+    assert held['blocked_for_seconds'] > 29
+
+
+def test_interactive_calls_are_served_before_batch():
+    pool = ClientPool([('key-1', 'client')], rpm=1, tpm=10000)
+    timed_acquire(pool, 10)
+    order = []
+    batch = threading.Thread(target=lambda: order.append(timed_acquire(pool, 10, 'batch') and 'batch'))
+    batch.start()
+    time.sleep(0.05)
+    interactive = threading.Thread(target=lambda: order.append(timed_acquire(pool, 10) and 'interactive'))
+    interactive.start()
+    join(interactive)
+    join(batch)
+    assert order == ['interactive', 'batch']
+
+
+def test_failing_check_gives_up_waiting():
+    pool = ClientPool([('key-1', 'client')], rpm=1, tpm=10000)
+    timed_acquire(pool, 10)
+
+    def check():
+        raise TimeoutError('deadline passed')
+
+    with pytest.raises(TimeoutError):
+        pool.acquire(10, check=check)
+    assert pool.stats()['queue_depth'] == 0
+    # The withdrawn ticket doesn't block later callers
+    assert timed_acquire(pool, 10)[1] < 1
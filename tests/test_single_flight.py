@@ -0,0 +1,186 @@
+import threading
+import time
+
+from single_flight import CancelledFlightError, SingleFlight
+
+
+TIMEOUT = 5
+
+
+def wait_until(condition):
+    deadline = time.monotonic() + TIMEOUT
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out waiting'
+        time.sleep(0.01)
+
+
+def wait_for_leader(flights):
+    wait_until(lambda: flights.stats()['leaders'] >= 1)
+
+
+def wait_for_followers(flights, count):
+    wait_until(lambda: flights.stats()['followers'] >= count)
+
+
+def join(thread):
+    thread.join(TIMEOUT)
+    assert not thread.is_alive()
+
+
+def test_concurrent_calls_share_one_result():
+    flights = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def call():
+        calls.append(1)
+        release.wait(5)
+        return 'result'
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flights.do('key', call)))
+    leader.start()
+    wait_for_leader(flights)
+    followers = [threading.Thread(target=lambda: results.append(flights.do('key', call))) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    wait_for_followers(flights, 3)
+    release.set()
+    for thread in [leader] + followers:
+        join(thread)
+
+    assert len(calls) == 1
+    assert sorted(results) == [('result', False)] + [('result', True)] * 3
+    assert flights.stats()['in_flight'] == 0
+
+
+def test_followers_share_the_leaders_exception():
+    flights = SingleFlight()
+    release = threading.Event()
+
+    def call():
+        release.wait(5)
+        raise ValueError('upstream failed')
+
+    errors = []
+
+    def run():
+        try:
+            flights.do('key', call)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run) for _ in range(2)]
+    threads[0].start()
+    wait_for_leader(flights)
+    threads[1].start()
+    wait_for_followers(flights, 1)
+    release.set()
+    for thread in threads:
+        join(thread)
+
+    assert len(errors) == 2 and errors[0] is errors[1]
+
+
+def test_key_is_free_once_the_call_finishes():
+    flights = SingleFlight()
+    assert flights.do('key', lambda: 1) == (1, False)
+    assert flights.do('key', lambda: 2) == (2, False)
+    assert flights.stats()['leaders'] == 2
+
+
+def test_stream_follower_replays_earlier_items():
+    flights = SingleFlight()
+    release = threading.Event()
+
+    def deltas():
+        yield 'a'
+        yield 'b'
+        release.wait(5)
+        yield 'c'
+
+    items, shared = flights.stream('key', deltas)
+    assert not shared
+    assert next(items) == 'a' and next(items) == 'b'
+
+    follower, shared = flights.stream('key', deltas)
+    assert shared
+    received = []
+    thread = threading.Thread(target=lambda: received.extend(follower))
+    thread.start()
+    release.set()
+    assert list(items) == ['c']
+    join(thread)
+
+    assert received == ['a', 'b', 'c']
+
+
+def test_closing_the_leader_cancels_its_followers():
+    flights = SingleFlight()
+
+    def deltas():
+        yield 'a'
+        yield 'b'
+
+    items, _ = flights.stream('key', deltas)
+    assert next(items) == 'a'
+    follower, _ = flights.stream('key', deltas)
+    received = []
+    errors = []
+
+    def follow():
+        try:
+            for item in follower:
+                received.append(item)
+        except CancelledFlightError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=follow)
+    thread.start()
+    items.close()
+    join(thread)
+
+    assert received == ['a']
+    assert len(errors) == 1
+    # The key is free for the follower to start its own call
+    assert flights.stream('key', deltas)[1] is False
+
+
+def test_stream_and_do_flights_are_kept_apart():
+    flights = SingleFlight()
+    items, _ = flights.stream('key', lambda: iter(['a']))
+    assert flights.do('key', lambda: 'result') == ('result', False)
+    assert list(items) == ['a']
+
+
+
+def test_failing_check_stops_a_follower_waiting():
+    flights = SingleFlight()
+    release = threading.Event()
+    gone = threading.Event()
+
+    def check():
+        if gone.is_set():
+            raise ConnectionError('client went away')
+
+    leader = threading.Thread(target=lambda: flights.do('key', lambda: release.wait(5) and 'result'))
+    leader.start()
+    wait_for_leader(flights)
+    errors = []
+
+    def follow():
+        try:
+            flights.do('key', lambda: 'own result', check=check)
+        except ConnectionError as e:
+            errors.append(e)
+
+    follower = threading.Thread(target=follow)
+    follower.start()
+    wait_for_followers(flights, 1)
+    gone.set()
+    join(follower)
+    assert len(errors) == 1
+    # The leader's call carries on
+    assert flights.stats()['in_flight'] == 1
+    release.set()
+    join(leader)
@@ -0,0 +1,136 @@
+import math
+import re
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding('cl100k_base')
+except Exception:  # tiktoken is optional; fall back to the ~4 characters per token rule
+    _encoding = None
+
+# Context windows of the chat models we route to, in tokens
+CONTEXT_WINDOWS = {
+    'gpt-3.5-turbo': 16385,
+    'gpt-4o-mini': 128000,
+    'gpt-4o': 128000
+}
+DEFAULT_CONTEXT_WINDOW = 4096
+
+HEADING = re.compile(r'^\s*(#{1,6}\s+\S|\*\*[^*]+\*\*:?\s*$)')
+BULLET = re.compile(r'^\s*([-*•+]|\d+(\.\d+)*[.)])\s+')
+NUMBERED = re.compile(r'^\s*(\d+(\.\d+)*[.)]|[A-Z]{2,}-\d+:?)\s+')
+KEY_LINE = re.compile(
+    r'\b(as an? |acceptance criteria|given|when|then|shall|must|priority|story points|requirement)\b', re.IGNORECASE
+)
+CRITERIA = re.compile(r'acceptance criteria', re.IGNORECASE)
+BOILERPLATE = re.compile(
+    r'^\s*(sure|certainly|of course|absolutely|here (is|are)|below (is|are)|in conclusion|in summary|'
+    r'overall,|i hope|let me know|feel free|note that|this (document|specification) (outlines|provides))\b',
+    re.IGNORECASE
+)
+RULE = re.compile(r'^\s*([-*_=]\s*){3,}$')
+MARKUP = re.compile(r'[#*_`>]+')
+
+TRUNCATION_MARKER = '[... truncated to fit the token budget]'
+
+
+def count_tokens(text):
+    """Local token count: exact with tiktoken installed, otherwise a close estimate"""
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / 4)
+
+
+def context_window(model):
+    return CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+
+
+def deduplicate(text):
+    """Drop boilerplate, horizontal rules, repeated headings and sentences, and repeated blank lines"""
+    seen = set()
+    lines = []
+    for line in text.splitlines():
+        if RULE.match(line) or BOILERPLATE.match(line):
+            continue
+        if not line.strip():
+            if lines and lines[-1]:
+                lines.append('')
+            continue
+        # Short labels such as "Acceptance Criteria:" repeat legitimately; headings and sentences don't
+        key = ' '.join(MARKUP.sub('', line).lower().split())
+        if HEADING.match(line) or len(key.split()) >= 8:
+            if key in seen:
+                continue
+            seen.add(key)
+        lines.append(line.rstrip())
+    return '\n'.join(lines).strip()
+
+
+def extract_key_lines(text):
+    """Keep headings, numbered requirements, user stories and their acceptance criteria"""
+    kept = []
+    in_criteria = False
+    for line in text.splitlines():
+        if HEADING.match(line):
+            in_criteria = False
+            kept.append(line)
+        elif CRITERIA.search(line):
+            in_criteria = True
+            kept.append(line)
+        elif NUMBERED.match(line) or KEY_LINE.search(line):
+            kept.append(line)
+        elif in_criteria and BULLET.match(line):
+            kept.append(line)
+        elif line.strip():
+            in_criteria = False
+    return '\n'.join(kept)
+
+
+def truncate(text, budget):
+    """Keep whole lines from the start of ``text`` up to ``budget`` tokens"""
+    budget -= count_tokens(TRUNCATION_MARKER) + 1
+    kept = []
+    used = 0
+    for line in text.splitlines():
+        cost = count_tokens(line) + 1
+        if used + cost > budget:
+            break
+        kept.append(line)
+        used += cost
+    return '\n'.join(kept + [TRUNCATION_MARKER])
+
+
+def compact(text, budget):
+    """Shrink ``text`` to at most ``budget`` tokens, applying cheaper reductions first"""
+    if count_tokens(text) <= budget:
+        return text
+    text = deduplicate(text)
+    if count_tokens(text) <= budget:
+        return text
+    extracted = extract_key_lines(text)
+    if extracted and count_tokens(extracted) <= budget:
+        return extracted
+    return truncate(extracted or text, budget)
+
+
+def fit_prompt(template, budget, **fields):
+    """Render ``template`` within ``budget`` tokens by compacting its fields.
+
+    The fields share whatever the template itself leaves of the budget, in
+    proportion to their size. Returns the rendered prompt and the number of
+    tokens it saved compared with rendering the fields untouched.
+    """
+    original = template.format(**fields)
+    original_tokens = count_tokens(original)
+    if original_tokens <= budget:
+        return original, 0
+
+    overhead = count_tokens(template.format(**{name: '' for name in fields}))
+    available = max(budget - overhead, 0)
+    sizes = {name: count_tokens(value) for name, value in fields.items()}
+    total = sum(sizes.values()) or 1
+    compacted = {
+        name: compact(value, max(available * sizes[name] // total, 1))
+        for name, value in fields.items()
+    }
+    prompt = template.format(**compacted)
+    return prompt, max(original_tokens - count_tokens(prompt), 0)
@@ -0,0 +1,209 @@
+import random
+import socket
+import threading
+import time
+
+import httpx
+import openai
+
+from cancellation import PipelineCancelled
+
+# Statuses worth another attempt: request timeout, lock conflict, rate limit and server errors
+RETRYABLE_STATUSES = {408, 409, 429}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the API while the circuit breaker is open"""
+
+
+def is_upstream_failure(error):
+    """Whether ``error`` says the API itself is unreachable, slow or failing (as opposed to a bad request)"""
+    if isinstance(error, openai.APIConnectionError):  # includes APITimeoutError
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def is_retryable(error):
+    if is_upstream_failure(error):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code in RETRYABLE_STATUSES
+
+
+def hang_up(response):
+    """Shut down the connection under an httpx ``response`` so a read blocked on it in another thread returns.
+
+    The reading thread still closes the response; the connection is then discarded rather than reused.
+    """
+    network_stream = response.extensions.get('network_stream')
+    sock = network_stream.get_extra_info('socket') if network_stream is not None else None
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            # Already closed
+            pass
+
+
+class CircuitBreaker:
+    """Fails calls fast once the API has failed ``failure_threshold`` times in a row.
+
+    After ``reset_timeout`` seconds one trial call is let through (half-open);
+    its success closes the circuit again and its failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected = 0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == 'open' and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+            if self.state == 'closed':
+                return
+            if self.state == 'half_open' and not self._trial_running:
+                self._trial_running = True
+                return
+            self.rejected += 1
+            retry_in = max(0.0, self.opened_at + self.reset_timeout - time.time())
+        raise CircuitOpenError(
+            f"OpenAI API unavailable after {self.failures} consecutive failures; retrying in {retry_in:.0f}s"
+        )
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._trial_running = False
+
+    def record_cancelled(self):
+        """A call we gave up on says nothing about the API; just let another trial through"""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == 'half_open' or (self.state == 'closed' and self.failures >= self.failure_threshold):
+                self.state = 'open'
+                self.opened_at = time.time()
+                self.times_opened += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'failure_threshold': self.failure_threshold,
+                'reset_timeout_seconds': self.reset_timeout,
+                'open_for_seconds': round(max(0.0, self.opened_at + self.reset_timeout - time.time()), 3)
+                if self.state == 'open' else 0.0,
+                'times_opened': self.times_opened,
+                'rejected_calls': self.rejected
+            }
+
+
+class Transport:
+    """The HTTP layer every agent call goes through.
+
+    One keep-alive connection pool is shared by the clients of every API key.
+    Each call gets its agent's connect/read timeouts, and retryable errors are
+    retried with exponentially growing, fully jittered delays. Calls are
+    refused while the circuit breaker is open. The SDK's own retries are off
+    so this is the only retry policy.
+    """
+
+    def __init__(self, max_connections=8, connect_timeout=5.0, read_timeout=60.0, agent_read_timeouts=None,
+                 max_retries=3, backoff_base=0.5, backoff_max=8.0, breaker=None):
+        self.max_connections = max_connections
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.agent_read_timeouts = dict(agent_read_timeouts or {})
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.http_client = openai.DefaultHttpxClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=openai.Timeout(read_timeout, connect=connect_timeout)
+        )
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def client(self, api_key, base_url=None):
+        return openai.OpenAI(api_key=api_key, base_url=base_url, http_client=self.http_client, max_retries=0)
+
+    def timeout(self, agent, deadline=None):
+        """The agent's timeouts, with the read timeout cut short so the call ends by ``deadline``"""
+        read = self.agent_read_timeouts.get(agent, self.read_timeout)
+        if deadline is not None:
+            read = max(min(read, deadline - time.time()), 0.001)
+        return openai.Timeout(read, connect=self.connect_timeout)
+
+    def backoff(self, attempt):
+        """Full jitter: a random delay up to base * 2**attempt, capped at ``backoff_max``"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def record(self, error=None):
+        """Report the outcome of a call made outside ``call``, e.g. a stream that failed midway"""
+        if error is not None and is_upstream_failure(error):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def call(self, agent, request, deadline=None):
+        """Return ``request(timeout)``, retrying retryable errors with backoff.
+
+        With a ``deadline`` (epoch seconds), no attempt is timed to run past
+        it and no retry is made that would start after it.
+        """
+        with self._lock:
+            self.calls += 1
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            try:
+                result = request(self.timeout(agent, deadline))
+            except PipelineCancelled:
+                self.breaker.record_cancelled()
+                raise
+            except Exception as e:
+                # Any answer from the API, even a 400, shows it is up
+                self.record(e)
+                delay = self.backoff(attempt)
+                if (not is_retryable(e) or attempt >= self.max_retries
+                        or (deadline is not None and time.time() + delay >= deadline)):
+                    with self._lock:
+                        self.failures += 1
+                    raise
+                with self._lock:
+                    self.retries += 1
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.record()
+            return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_connections': self.max_connections,
+                'connect_timeout_seconds': self.connect_timeout,
+                'read_timeout_seconds': self.read_timeout,
+                'agent_read_timeout_seconds': self.agent_read_timeouts,
+                'max_retries': self.max_retries,
+                'calls': self.calls,
+                'retries': self.retries,
+                'failed_calls': self.failures,
+                'circuit_breaker': self.breaker.stats()
+            }
@@ -0,0 +1,60 @@
+"""Worker processes that drain the job queue created by POST /jobs.
+
+Usage:
+    python worker.py --processes 4
+
+To scale out across machines, point them at the same JOB_DB_PATH, RUN_STORE_PATH and
+other database paths on a shared volume with SHARED_DB_JOURNAL_MODE=delete; WAL only
+works on a local disk.
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import threading
+
+JOB_WORKER_PROCESSES = int(os.getenv('JOB_WORKER_PROCESSES', str(os.cpu_count() or 1)))
+
+
+def run_worker(threads):
+    # Imported here so each spawned process builds its own clients and database connections
+    from app import job_queue, run_job
+    from job_queue import work
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    workers = [threading.Thread(target=work, args=(job_queue, run_job), kwargs={'stop': stop}) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Process queued requirement jobs.')
+    parser.add_argument('-p', '--processes', type=int, default=JOB_WORKER_PROCESSES,
+                        help='worker processes to start (default: %(default)s)')
+    parser.add_argument('-t', '--threads', type=int, default=1,
+                        help='jobs each process runs at once (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    spawn = multiprocessing.get_context('spawn')
+    processes = [spawn.Process(target=run_worker, args=(args.threads,)) for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+
+    # Ask every worker to finish its current job and exit
+    def shutdown(*_):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    for process in processes:
+        process.join()
+
+
+if __name__ == '__main__':
+    main()